@@ -0,0 +1,116 @@
+"""本地磁盘缓存：各工具共用的缓存目录、文件指纹与按总大小淘汰的对象缓存"""
+import hashlib
+import os
+import pickle
+import tempfile
+
+CACHE_ROOT = os.path.join(os.path.expanduser("~"), ".toolcollectapp", "cache")
+
+
+def cache_dir(name):
+    """返回（并创建）指定名称的缓存子目录"""
+    path = os.path.join(CACHE_ROOT, name)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_signature(file_path):
+    """文件指纹：(绝对路径, 大小, 修改时间)，文件内容变化后指纹随之变化"""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+
+def make_key(*parts):
+    """把任意可 repr 的参数组合成定长缓存键"""
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """以 pickle 文件保存对象的磁盘缓存，总大小超过上限时淘汰最久未使用的条目
+
+    可被多个进程同时读写；缓存读写失败只当作未命中，不向调用方抛出异常。
+    """
+
+    def __init__(self, name, max_bytes=512 * 1024 * 1024):
+        try:
+            self.directory = cache_dir(name)
+        except OSError:
+            self.directory = os.path.join(CACHE_ROOT, name)  # 目录不可写：之后的读写都按未命中处理
+        self.max_bytes = max_bytes
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+
+    def get(self, key):
+        """读取缓存对象，不存在或损坏时返回 None；命中时刷新使用时间"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except OSError:
+            return None  # 不存在，或正被其他进程替换（Windows 下会拒绝访问）
+        except Exception:
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # 条目刚被其他进程淘汰或替换
+        return value
+
+    def put(self, key, value):
+        """写入缓存对象（先写各自的临时文件再替换，避免留下半个文件），然后按大小淘汰
+
+        多个进程同时写同一个键时以最后替换的为准；写入失败时放弃本次缓存。
+        """
+        path = self._path(key)
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except Exception:
+            if tmp_path is not None:
+                self._remove(tmp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        """按最近使用时间从旧到新删除条目，直到总大小不超过上限"""
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith(".pkl"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            self._remove(os.path.join(self.directory, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
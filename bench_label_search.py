@@ -0,0 +1,61 @@
+"""对比整表标签查找：原来的 iterrows 逐行循环 vs total_engine.find_label_cell 向量化查找
+
+用法：python bench_label_search.py [行数 ...]
+在内存中构造与日报相近的表（标题、表头、明细、合计行在末尾附近），两种方法结果一致才计时。
+"""
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from total_engine import TOTAL_LABELS, find_label_cell
+
+COLUMNS = 8
+REPEAT = 3
+
+
+def make_frame(rows):
+    """构造 rows 行明细、合计在倒数第二行的表，列类型与 read_excel(header=None) 的结果相近（混合 object 列）"""
+    rng = np.random.default_rng(0)
+    data = {
+        0: ["明细"] * rows,
+        1: [f"商品{i}" for i in range(rows)],
+        2: rng.integers(0, 1000, rows),
+        3: rng.random(rows) * 100,
+        4: ["备注文字"] * rows,
+    }
+    for col in range(5, COLUMNS):
+        data[col] = rng.random(rows)
+    df = pd.DataFrame(data).astype(object)
+    head = pd.DataFrame([["某某门店营业日报"] + [None] * (COLUMNS - 1),
+                         ["日期", "品类", "数量", "金额", "备注"] + [None] * (COLUMNS - 5)])
+    tail = pd.DataFrame([[None, None, "合计"] + [None] * (COLUMNS - 3),
+                         [None, None, 12345.6] + [None] * (COLUMNS - 3)])
+    return pd.concat([head, df, tail], ignore_index=True)
+
+
+def iterrows_search(df, label="合计"):
+    """原 process_excel 中的查找方式"""
+    for i, row in df.iterrows():
+        if label in str(row.values):
+            break
+    else:
+        return None
+    col = row.index[row.apply(lambda x: label in str(x))][0]
+    return i, int(col)
+
+
+def main(sizes):
+    print(f"{'行数':>8} {'iterrows(秒)':>14} {'向量化(秒)':>12} {'加速比':>8}")
+    for rows in sizes:
+        df = make_frame(rows)
+        expected = iterrows_search(df)
+        assert find_label_cell(df, TOTAL_LABELS) == expected, (find_label_cell(df, TOTAL_LABELS), expected)
+        old = min(timeit.repeat(lambda: iterrows_search(df), number=1, repeat=REPEAT))
+        new = min(timeit.repeat(lambda: find_label_cell(df, TOTAL_LABELS), number=1, repeat=REPEAT))
+        print(f"{rows:>8} {old:>14.4f} {new:>12.4f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
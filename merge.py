@@ -1,6 +1,9 @@
 import sys
 import pandas as pd
 import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from PySide6 import QtWidgets, QtGui, QtCore
 from PySide6.QtGui import QKeySequence, QShortcut
 from PySide6.QtWidgets import (
@@ -16,6 +19,77 @@ from PySide6.QtWidgets import (
 )
 from PySide6.QtCore import Qt, Signal
 
+from merge_engine import (DUPLICATE_POLICIES, SOURCE_MODES, BatchFileResult, MergeCancelled, MergeError, MergeOptions,
+                          build_match_summary, build_unmatched_report, collect_target_files, detect_header_row,
+                          fill_target_sheet, init_lookup_worker, load_source_lookup, output_extension, patch_workbook,
+                          preflight_check, run_batch_file, run_sheet_task, split_column_names, write_sheets)
+
+
+DATA_FILE_SEPARATOR = ";"  # 数据文件输入框中多个文件的分隔符
+MATCH_SUMMARY_VIEW = "〔匹配汇总〕"  # 预览下拉框中的汇总视图名（括号避免与工作表重名）
+UNMATCHED_KEYS_VIEW = "〔未匹配键〕"
+PARALLEL_MIN_TARGET_BYTES = 2 * 1024 * 1024  # 目标文件小于此大小时逐个处理工作表：启动进程池（Windows 下为 spawn）比填充小表更慢
+
+
+class DataFrameModel(QtCore.QAbstractTableModel):
+    """基于 DataFrame 的只读表格模型：单元格在视图请求时才格式化，只处理可见行"""
+
+    def __init__(self, df=None, parent=None):
+        super().__init__(parent)
+        self.set_dataframe(df if df is not None else pd.DataFrame())
+
+    def set_dataframe(self, df):
+        self.beginResetModel()
+        self._df = df
+        self._headers = [str(c) for c in df.columns]
+        self._columns = [df.iloc[:, i].to_numpy() for i in range(df.shape[1])]  # 按列缓存，避免逐格 iloc
+        self.endResetModel()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._df)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns)
+
+    @staticmethod
+    def format_value(cell_value, col_idx):
+        """单元格显示文本（空值为空串，首列数字取整，其余数字保留两位小数）"""
+        if pd.isna(cell_value):
+            return ""
+        if col_idx == 0 and isinstance(cell_value, (int, float)):
+            return f"{int(cell_value)}"
+        if isinstance(cell_value, (int, float)):
+            return f"{cell_value:.2f}"
+        return str(cell_value)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        cell_value = self._columns[index.column()][index.row()]
+        if role == Qt.DisplayRole:
+            return self.format_value(cell_value, index.column())
+        if role == Qt.TextAlignmentRole:
+            if isinstance(cell_value, (int, float)) and not pd.isna(cell_value):
+                return int(Qt.AlignRight | Qt.AlignVCenter)
+            return int(Qt.AlignCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self._headers[section]
+        return str(section + 1)
+
+    def sample_column_widths(self, font_metrics, sample_rows=200, padding=28, max_width=320):
+        """根据表头与前若干行的显示文本估算列宽，避免按全部内容计算"""
+        widths = []
+        rows = min(sample_rows, len(self._df))
+        for col_idx, header in enumerate(self._headers):
+            texts = [header] + [self.format_value(v, col_idx) for v in self._columns[col_idx][:rows]]
+            widths.append(min(max(font_metrics.horizontalAdvance(t) for t in texts) + padding, max_width))
+        return widths
+
 
 class LogDialog(QDialog):
     """日志弹窗对话框"""
@@ -67,6 +141,431 @@ class LogDialog(QDialog):
             self.parent().status_bar.showMessage("✅ 日志已复制到剪贴板", 3000)
 
 
+def describe_source_info(info):
+    """数据文件读取情况的日志文本"""
+    if info.from_cache:
+        cache_note = "（使用缓存）"
+    elif info.cached_files:
+        cache_note = f"（{info.cached_files} 个文件使用缓存）"
+    else:
+        cache_note = ""
+    return f"数据文件读取完成{cache_note}：{info.files} 个文件，{info.sheets} 个工作表，{info.rows} 行"
+
+
+def run_preflight(options, log_signal, target_files=None):
+    """执行合并前预检并记录结果；发现问题时逐条记录并抛出 MergeError 终止合并"""
+    start = time.perf_counter()
+    problems = preflight_check(options, target_files)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if problems:
+        for problem in problems:
+            log_signal.emit(f"预检问题：{problem}")
+        raise MergeError(f"错误：预检发现 {len(problems)} 个问题，已取消合并（详见日志），耗时 {elapsed_ms:.0f} 毫秒")
+    log_signal.emit(f"预检通过：列名与行号设置均有效，耗时 {elapsed_ms:.0f} 毫秒")
+
+
+def report_duplicates(lookup, options, log_signal):
+    """把查找表构建时发现的重复键写入日志"""
+    if lookup.duplicates.duplicate_keys:
+        for idx, line in enumerate(lookup.duplicates.describe(options.duplicate_policy)):
+            log_signal.emit(f"⚠️ {line}" if idx == 0 else line)
+
+
+class MergeWorker(QtCore.QObject):
+    """后台合并任务：在独立线程中执行，通过信号回报日志、进度与每个工作表的结果"""
+    log_signal = Signal(str)
+    progress_signal = Signal(int, int)  # 已完成步骤数, 总步骤数
+    sheet_done_signal = Signal(str, pd.DataFrame, object)  # 工作表名, 合并结果, MatchStats
+    lookup_ready_signal = Signal(object)  # 构建好的 SourceLookup，供原格式写回使用
+    finished_signal = Signal()
+
+    def __init__(self, options):
+        super().__init__()
+        self.options = options
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """请求取消（可从任意线程调用）"""
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self):
+        """执行数据合并操作"""
+        options = self.options
+        try:
+            run_preflight(options, self.log_signal)
+
+            # 读取数据文件所有工作表，一次性构建查找表，供所有目标工作表共用
+            log_msg = "正在读取数据文件工作表..."
+            self.log_signal.emit(log_msg)
+
+            phase_start = time.perf_counter()
+            lookup, source_info = load_source_lookup(options, self.is_cancelled)
+            log_msg = (f"{describe_source_info(source_info)}，索引 {len(lookup)} 个唯一键，"
+                       f"耗时 {time.perf_counter() - phase_start:.2f} 秒")
+            self.log_signal.emit(log_msg)
+            report_duplicates(lookup, options, self.log_signal)
+            self.lookup_ready_signal.emit(lookup)
+
+            # 读取目标文件
+            log_msg = "正在读取目标文件..."
+            self.log_signal.emit(log_msg)
+
+            with pd.ExcelFile(options.target_file) as test1_xls:
+                sheet_names = test1_xls.sheet_names
+                log_msg = f"目标文件包含 {len(sheet_names)} 个工作表"
+                self.log_signal.emit(log_msg)
+                self.progress_signal.emit(0, len(sheet_names))
+
+                phase_start = time.perf_counter()
+                workers = min(len(sheet_names), os.cpu_count() or 1)
+                parallel = workers > 1 and os.path.getsize(options.target_file) >= PARALLEL_MIN_TARGET_BYTES
+                if not parallel:
+                    # 处理每个工作表
+                    for idx, sheet_name in enumerate(sheet_names, 1):
+                        if self.is_cancelled():
+                            raise MergeCancelled()
+
+                        log_msg = f"正在处理工作表 {idx}/{len(sheet_names)}：{sheet_name}"
+                        self.log_signal.emit(log_msg)
+
+                        sheet_start = time.perf_counter()
+                        test1_df, stats = fill_target_sheet(test1_xls, sheet_name, options, lookup)
+                        self.report_sheet(idx, len(sheet_names), sheet_name, test1_df, stats,
+                                          time.perf_counter() - sheet_start)
+
+            if parallel:
+                # 各工作表相互独立：分发到进程池并行读取与填充（子进程各自打开目标文件），按原工作表顺序收集结果
+                log_msg = f"使用 {workers} 个进程并行处理工作表"
+                self.log_signal.emit(log_msg)
+                self.run_sheets_parallel(sheet_names, lookup, workers)
+
+            log_msg = f"✅ 所有工作表处理完成！合并阶段耗时 {time.perf_counter() - phase_start:.2f} 秒"
+            self.log_signal.emit(log_msg)
+
+        except MergeError as e:
+            self.log_signal.emit(str(e))
+        except KeyError as e:
+            error_msg = f"错误（KeyError）：{str(e)}，请检查列名参数"
+            self.log_signal.emit(error_msg)
+        except pd.errors.EmptyDataError:
+            error_msg = "错误：读取的文件为空，请检查文件有效性"
+            self.log_signal.emit(error_msg)
+        except Exception as e:
+            error_msg = f"未知错误：{str(e)}"
+            self.log_signal.emit(error_msg)
+        finally:
+            self.finished_signal.emit()
+
+    def run_sheets_parallel(self, sheet_names, lookup, workers):
+        """在进程池中并行处理各工作表，按原顺序回报结果"""
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=init_lookup_worker, initargs=(lookup,))
+        try:
+            futures = [executor.submit(run_sheet_task, self.options, sheet_name) for sheet_name in sheet_names]
+            for idx, future in enumerate(futures, 1):
+                while not future.done():
+                    if self.is_cancelled():
+                        raise MergeCancelled()
+                    wait([future], timeout=0.2)
+                sheet_name, test1_df, stats, seconds = future.result()
+                self.report_sheet(idx, len(sheet_names), sheet_name, test1_df, stats, seconds)
+        except BaseException:
+            # 出错或取消时丢弃尚未开始的工作表，不等待正在处理的工作表
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+    def report_sheet(self, idx, total, sheet_name, test1_df, stats, seconds):
+        """回报单个工作表的处理结果与进度"""
+        if test1_df is None:
+            log_msg = f"警告：{sheet_name} 为空，已跳过"
+            self.log_signal.emit(log_msg)
+        else:
+            log_msg = (f"{sheet_name} 处理完成：匹配 {stats.matched} 行，未匹配 {stats.unmatched} 行"
+                       f"{f'（其中空键 {stats.blank} 行）' if stats.blank else ''}，"
+                       f"{f'重复键 {stats.duplicate} 行，' if stats.duplicate else ''}耗时 {seconds:.2f} 秒")
+            if stats.by_source:
+                log_msg += "（" + "，".join(f"{name} {count} 行" for name, count in stats.by_source.items()) + "）"
+            self.log_signal.emit(log_msg)
+
+            # 更新当前合并结果并刷新表格预览（结果交给界面持有，工作线程不再使用，无需复制）
+            self.sheet_done_signal.emit(sheet_name, test1_df, stats)
+
+        self.progress_signal.emit(idx, total)
+
+
+class SaveInPlaceWorker(QtCore.QObject):
+    """后台原格式写回任务：大模板的完整加载与保存较慢，放在独立线程中执行以免界面卡住"""
+    log_signal = Signal(str)
+    finished_signal = Signal()
+
+    def __init__(self, options, lookup, file_path):
+        super().__init__()
+        self.options = options
+        self.lookup = lookup
+        self.file_path = file_path
+
+    def run(self):
+        start = time.perf_counter()
+        try:
+            results = patch_workbook(self.options, self.lookup, self.file_path)
+            for sheet_name, stats in results.items():
+                self.log_signal.emit(f"{sheet_name} 已写回：匹配 {stats.matched} 行，未匹配 {stats.unmatched} 行")
+            msg = (f"✅ 已按目标文件原格式保存 {len(results)} 个工作表到：{self.file_path}，"
+                   f"耗时 {time.perf_counter() - start:.2f} 秒")
+            self.log_signal.emit(msg)
+        except Exception as e:
+            self.log_signal.emit(f"保存失败：{str(e)}")
+        finally:
+            self.finished_signal.emit()
+
+
+class BatchMergeWorker(QtCore.QObject):
+    """后台批量合并任务：查找表只构建一次，多个目标文件在进程池中并行填充"""
+    log_signal = Signal(str)
+    progress_signal = Signal(int, int)  # 已完成文件数, 总文件数
+    file_done_signal = Signal(object)  # BatchFileResult
+    finished_signal = Signal()
+
+    def __init__(self, options, target_files, in_place=False):
+        super().__init__()
+        self.options = options
+        self.target_files = target_files
+        self.in_place = in_place
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """请求取消（尚未开始的文件不再处理）"""
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self):
+        """构建查找表并把目标文件分发到进程池"""
+        options = self.options
+        total = len(self.target_files)
+        try:
+            run_preflight(options, self.log_signal, self.target_files)
+
+            self.log_signal.emit("批量合并：正在读取数据文件工作表...")
+            phase_start = time.perf_counter()
+            lookup, source_info = load_source_lookup(options, self.is_cancelled)
+            self.log_signal.emit(f"{describe_source_info(source_info)}，"
+                                 f"耗时 {time.perf_counter() - phase_start:.2f} 秒")
+            report_duplicates(lookup, options, self.log_signal)
+
+            workers = min(total, os.cpu_count() or 1)
+            self.log_signal.emit(f"批量合并：{total} 个目标文件，{workers} 个进程并行处理")
+            self.progress_signal.emit(0, total)
+
+            phase_start = time.perf_counter()
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=init_lookup_worker, initargs=(lookup,))
+            try:
+                futures = {
+                    executor.submit(run_batch_file, options, target_file, self.in_place): target_file
+                    for target_file in self.target_files
+                }
+                done = 0
+                pending = set(futures)
+                while pending and not self.is_cancelled():
+                    finished, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        done += 1
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            result = BatchFileResult(target_file=futures[future], error=str(e))
+                        self.file_done_signal.emit(result)
+                        self.progress_signal.emit(done, total)
+            except BaseException:
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+            # 取消时丢弃尚未开始的文件，不等待正在处理的文件
+            executor.shutdown(wait=not self.is_cancelled(), cancel_futures=True)
+
+            if self.is_cancelled():
+                raise MergeCancelled()
+            self.log_signal.emit(f"✅ 批量合并完成！共 {total} 个文件，耗时 {time.perf_counter() - phase_start:.2f} 秒")
+
+        except MergeError as e:
+            self.log_signal.emit(str(e))
+        except Exception as e:
+            self.log_signal.emit(f"批量合并未知错误：{str(e)}")
+        finally:
+            self.finished_signal.emit()
+
+
+class BatchMergeDialog(QDialog):
+    """批量合并对话框：同一个数据文件填充多个目标文件，输出到各自所在目录"""
+    SUMMARY_HEADERS = ["目标文件", "工作表数", "匹配行数", "未匹配行数", "耗时(秒)", "输出文件 / 错误"]
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("批量合并")
+        self.resize(900, 560)
+        self.batch_thread = None
+        self.batch_worker = None
+
+        main_layout = QVBoxLayout(self)
+
+        # 目标文件列表
+        main_layout.addWidget(QtWidgets.QLabel("目标文件（使用主窗口的数据文件与参数设置）："))
+        self.file_list = QtWidgets.QListWidget()
+        self.file_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        main_layout.addWidget(self.file_list, 1)
+
+        file_btn_layout = QHBoxLayout()
+        self.add_files_btn = QPushButton("添加文件")
+        self.add_folder_btn = QPushButton("添加文件夹")
+        self.remove_btn = QPushButton("移除选中")
+        self.clear_btn = QPushButton("清空列表")
+        for btn in (self.add_files_btn, self.add_folder_btn, self.remove_btn, self.clear_btn):
+            file_btn_layout.addWidget(btn)
+        file_btn_layout.addStretch(1)
+        main_layout.addLayout(file_btn_layout)
+
+        # 运行控制
+        run_layout = QHBoxLayout()
+        self.run_btn = QPushButton("开始批量合并")
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.setEnabled(False)
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setRange(0, 1)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%v / %m 个文件")
+        run_layout.addWidget(self.run_btn)
+        run_layout.addWidget(self.cancel_btn)
+        run_layout.addWidget(self.progress_bar, 1)
+        main_layout.addLayout(run_layout)
+
+        # 汇总表
+        self.summary_table = QtWidgets.QTableWidget(0, len(self.SUMMARY_HEADERS))
+        self.summary_table.setHorizontalHeaderLabels(self.SUMMARY_HEADERS)
+        self.summary_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.summary_table.horizontalHeader().setStretchLastSection(True)
+        main_layout.addWidget(self.summary_table, 2)
+
+        self.add_files_btn.clicked.connect(self.add_files)
+        self.add_folder_btn.clicked.connect(self.add_folder)
+        self.remove_btn.clicked.connect(self.remove_selected)
+        self.clear_btn.clicked.connect(self.file_list.clear)
+        self.run_btn.clicked.connect(self.run_batch)
+        self.cancel_btn.clicked.connect(self.cancel_batch)
+
+    def target_files(self):
+        return [self.file_list.item(i).data(Qt.UserRole) for i in range(self.file_list.count())]
+
+    def add_target_files(self, file_paths):
+        existing = set(self.target_files())
+        for file_path in file_paths:
+            if file_path in existing:
+                continue
+            item = QtWidgets.QListWidgetItem(os.path.basename(file_path))
+            item.setData(Qt.UserRole, file_path)
+            item.setToolTip(file_path)
+            self.file_list.addItem(item)
+            existing.add(file_path)
+
+    def add_files(self):
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, "选择目标文件", "", "Excel文件 (*.xlsx *.xlsm);;所有文件 (*)"
+        )
+        self.add_target_files(file_paths)
+
+    def add_folder(self):
+        folder = QFileDialog.getExistingDirectory(self, "选择目标文件所在文件夹")
+        if folder:
+            self.add_target_files(collect_target_files(folder))
+
+    def remove_selected(self):
+        for item in self.file_list.selectedItems():
+            self.file_list.takeItem(self.file_list.row(item))
+
+    def run_batch(self):
+        """使用主窗口参数启动批量合并"""
+        if self.batch_thread is not None:
+            return
+        target_files = self.target_files()
+        if not target_files:
+            self.parent().log_update_signal.emit("提示：请先添加目标文件")
+            return
+        options = self.parent().collect_options(first_file=target_files[0])
+        if options is None:
+            return
+
+        self.summary_table.setRowCount(0)
+        self.batch_thread = QtCore.QThread(self)
+        self.batch_worker = BatchMergeWorker(options, target_files, self.parent().inplace_checkbox.isChecked())
+        self.batch_worker.moveToThread(self.batch_thread)
+
+        self.batch_thread.started.connect(self.batch_worker.run)
+        self.batch_worker.log_signal.connect(self.parent().log_update_signal)
+        self.batch_worker.progress_signal.connect(self.update_progress)
+        self.batch_worker.file_done_signal.connect(self.add_summary_row)
+        self.batch_worker.finished_signal.connect(self.batch_thread.quit)
+        self.batch_worker.finished_signal.connect(self.batch_worker.deleteLater)
+        self.batch_thread.finished.connect(self.on_batch_finished)
+
+        self.run_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
+        self.progress_bar.setRange(0, 0)
+        self.batch_thread.start()
+
+    def cancel_batch(self):
+        if self.batch_worker is not None:
+            self.batch_worker.cancel()
+            self.cancel_btn.setEnabled(False)
+
+    def update_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    def add_summary_row(self, result):
+        """在汇总表中追加一个文件的处理结果"""
+        row = self.summary_table.rowCount()
+        self.summary_table.insertRow(row)
+        values = [
+            os.path.basename(result.target_file),
+            str(result.sheets),
+            str(result.matched),
+            str(result.unmatched),
+            f"{result.seconds:.2f}",
+            f"失败：{result.error}" if result.error else result.output_file,
+        ]
+        for col, text in enumerate(values):
+            item = QTableWidgetItem(text)
+            item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter if 0 < col < 5 else Qt.AlignLeft | Qt.AlignVCenter)
+            self.summary_table.setItem(row, col, item)
+
+        if result.error:
+            log_msg = f"批量合并失败：{os.path.basename(result.target_file)}，{result.error}"
+        else:
+            log_msg = (f"批量合并完成：{os.path.basename(result.target_file)}，匹配 {result.matched} 行，"
+                       f"未匹配 {result.unmatched} 行，耗时 {result.seconds:.2f} 秒")
+        self.parent().log_update_signal.emit(log_msg)
+
+    def on_batch_finished(self):
+        self.batch_thread.deleteLater()
+        self.batch_thread = None
+        self.batch_worker = None
+        self.run_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
+        if self.progress_bar.maximum() == 0:
+            self.progress_bar.setRange(0, 1)
+        self.summary_table.resizeColumnsToContents()
+
+    def reject(self):
+        """关闭对话框（含 Esc 与窗口关闭按钮）时取消并等待批量任务结束"""
+        if self.batch_thread is not None:
+            self.batch_worker.cancel()
+            self.batch_thread.quit()
+            self.batch_thread.wait()
+        super().reject()
+
+
 class ExcelMergerApp(QMainWindow):
     """Excel数据合并工具主窗口"""
     update_table_signal = Signal(pd.DataFrame)
@@ -74,7 +573,17 @@ class ExcelMergerApp(QMainWindow):
 
     def __init__(self):
         super().__init__()
-        self.current_merged_df = None  # 存储当前合并后的DataFrame
+        self.current_merged_df = None  # 存储当前预览的DataFrame
+        self.merged_sheets = {}  # 所有已处理工作表的结果 {工作表名: DataFrame}
+        self.sheet_stats = {}  # 各工作表的匹配统计 {工作表名: MatchStats}
+        self.report_views = {}  # 合并完成后生成的汇总视图 {视图名: DataFrame}，不随结果保存
+        self.merge_options = None  # 最近一次合并的参数
+        self.merge_lookup = None  # 最近一次合并构建的查找表
+        self.merge_thread = None  # 后台合并线程
+        self.save_thread = None  # 后台原格式写回线程
+        self.save_worker = None
+        self.merge_worker = None  # 后台合并任务
+        self.batch_dialog = None  # 批量合并对话框
         self.log_buffer = ""  # 日志缓存，用于保存完整日志
         self.init_ui()
         self.bind_signals()
@@ -104,7 +613,8 @@ class ExcelMergerApp(QMainWindow):
         # 数据文件选择
         data_file_label = QtWidgets.QLabel("数据文件:")
         self.second_file_input = QtWidgets.QLineEdit()
-        self.second_file_input.setPlaceholderText("请选择提供数据的Excel文件")
+        self.second_file_input.setPlaceholderText("请选择提供数据的Excel文件（可多选）")
+        self.second_file_input.setToolTip("多个数据文件用 ; 分隔，排在后面的文件优先（覆盖前面文件中相同的键）")
         self.second_file_button = QtWidgets.QPushButton("浏览")
 
         # 添加到文件布局
@@ -137,6 +647,7 @@ class ExcelMergerApp(QMainWindow):
         param_layout.addWidget(QtWidgets.QLabel("目标文件匹配列名:"), 1, 0, Qt.AlignRight)
         self.first_col_name_input = QtWidgets.QLineEdit()
         self.first_col_name_input.setText("商品名称")
+        self.first_col_name_input.setToolTip("多个匹配列用逗号分隔，如：商品名称,规格,单位")
         param_layout.addWidget(self.first_col_name_input, 1, 1)
 
         param_layout.addWidget(QtWidgets.QLabel("目标文件待填列名:"), 2, 0, Qt.AlignRight)
@@ -154,6 +665,7 @@ class ExcelMergerApp(QMainWindow):
         param_layout.addWidget(QtWidgets.QLabel("数据文件匹配列名:"), 1, 2, Qt.AlignRight)
         self.second_col_name_input = QtWidgets.QLineEdit()
         self.second_col_name_input.setText("商品名称")
+        self.second_col_name_input.setToolTip("多个匹配列用逗号分隔，顺序与目标文件匹配列一一对应")
         param_layout.addWidget(self.second_col_name_input, 1, 3)
 
         param_layout.addWidget(QtWidgets.QLabel("数据文件来源列名:"), 2, 2, Qt.AlignRight)
@@ -161,8 +673,73 @@ class ExcelMergerApp(QMainWindow):
         self.second_data_col_input.setText("TG")
         param_layout.addWidget(self.second_data_col_input, 2, 3)
 
+        # 匹配方式
+        self.normalize_checkbox = QtWidgets.QCheckBox("标准化匹配键")
+        self.normalize_checkbox.setToolTip("匹配前忽略首尾及多余空格、全角/半角、大小写差异，并统一数字编码（如 001 与 1）")
+        param_layout.addWidget(self.normalize_checkbox, 3, 0, Qt.AlignRight)
+
+        # 输出方式
+        self.inplace_checkbox = QtWidgets.QCheckBox("保存时保留目标文件格式（仅写入待填列）")
+        self.inplace_checkbox.setToolTip("在目标文件原有格式、公式与合并单元格基础上只改写待填列，另存为新文件")
+        param_layout.addWidget(self.inplace_checkbox, 3, 1)
+
+        # 数据文件缓存
+        self.cache_checkbox = QtWidgets.QCheckBox("缓存数据文件解析结果")
+        self.cache_checkbox.setChecked(True)
+        self.cache_checkbox.setToolTip("数据文件未修改时直接使用上次解析的结果，跳过Excel读取")
+        param_layout.addWidget(self.cache_checkbox, 3, 3)
+
+        # 重复键处理
+        param_layout.addWidget(QtWidgets.QLabel("数据文件重复键:"), 4, 0, Qt.AlignRight)
+        self.duplicate_policy_input = QtWidgets.QComboBox()
+        for policy, label in DUPLICATE_POLICIES.items():
+            self.duplicate_policy_input.addItem(label, policy)
+        self.duplicate_policy_input.setToolTip("同一数据文件中同一个键出现多次时的取值方式；冲突的键会记录在日志中")
+        param_layout.addWidget(self.duplicate_policy_input, 4, 1)
+
+        # 列名行号识别
+        self.detect_header_btn = QtWidgets.QPushButton("自动识别列名行号")
+        self.detect_header_btn.setToolTip("在两个文件的前几行中查找上方填写的列名，自动设置列名行号；选择文件后也会自动识别")
+        param_layout.addWidget(self.detect_header_btn, 4, 3)
+
+        # 数据文件读取方式
+        param_layout.addWidget(QtWidgets.QLabel("数据文件读取方式:"), 5, 0, Qt.AlignRight)
+        self.source_mode_input = QtWidgets.QComboBox()
+        for mode, label in SOURCE_MODES.items():
+            self.source_mode_input.addItem(label, mode)
+        self.source_mode_input.setToolTip("流式读取只保留匹配列与来源列；磁盘索引把查找表放在临时SQLite文件中，"
+                                          "适合几十万行以上、内存放不下的数据文件（不使用解析缓存）")
+        param_layout.addWidget(self.source_mode_input, 5, 1)
+
+        # 内存压缩
+        self.compact_checkbox = QtWidgets.QCheckBox("压缩内存占用")
+        self.compact_checkbox.setChecked(True)
+        self.compact_checkbox.setToolTip("整数列使用最小整数类型，单位、分类、供应商等重复文本列转换为分类类型，多工作表合并时显著省内存")
+        param_layout.addWidget(self.compact_checkbox, 5, 3)
+
         main_layout.addLayout(param_layout)
 
+        # 附加列映射：一次读取数据文件，同时填充多个待填列
+        mapping_layout = QtWidgets.QHBoxLayout()
+        mapping_layout.setSpacing(8)
+        mapping_label = QtWidgets.QLabel("附加列映射:")
+        mapping_label.setToolTip("除上方来源列/待填列外，需要一并填充的列")
+        self.mapping_table = QtWidgets.QTableWidget(0, 2)
+        self.mapping_table.setHorizontalHeaderLabels(["数据文件来源列", "目标文件待填列"])
+        self.mapping_table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        self.mapping_table.verticalHeader().setVisible(False)
+        self.mapping_table.setFixedHeight(90)
+        mapping_btn_layout = QtWidgets.QVBoxLayout()
+        self.add_mapping_btn = QtWidgets.QPushButton("添加映射")
+        self.remove_mapping_btn = QtWidgets.QPushButton("删除映射")
+        mapping_btn_layout.addWidget(self.add_mapping_btn)
+        mapping_btn_layout.addWidget(self.remove_mapping_btn)
+        mapping_btn_layout.addStretch(1)
+        mapping_layout.addWidget(mapping_label, 0, Qt.AlignTop)
+        mapping_layout.addWidget(self.mapping_table, 1)
+        mapping_layout.addLayout(mapping_btn_layout)
+        main_layout.addLayout(mapping_layout)
+
         # ---------------------- 功能按钮布局 ----------------------
         btn_main_layout = QtWidgets.QHBoxLayout()
         btn_main_layout.setSpacing(15)
@@ -172,6 +749,12 @@ class ExcelMergerApp(QMainWindow):
         self.run_button.setCursor(Qt.PointingHandCursor)
         self.run_button.setFixedWidth(120)
 
+        # 取消合并按钮
+        self.cancel_button = QtWidgets.QPushButton("取消合并")
+        self.cancel_button.setCursor(Qt.PointingHandCursor)
+        self.cancel_button.setFixedWidth(100)
+        self.cancel_button.setEnabled(False)
+
         # 2. 复制全部按钮
         self.copy_all_btn = QtWidgets.QPushButton("复制全部表格内容")
         self.copy_all_btn.setCursor(Qt.PointingHandCursor)
@@ -181,9 +764,15 @@ class ExcelMergerApp(QMainWindow):
         # 3. 保存按钮
         self.save_to_excel_btn = QtWidgets.QPushButton("保存到Excel文件")
         self.save_to_excel_btn.setCursor(Qt.PointingHandCursor)
-        self.save_to_excel_btn.setToolTip("将预览表格数据保存为Excel文件")
+        self.save_to_excel_btn.setToolTip("将所有工作表的合并结果保存为Excel文件")
         self.save_to_excel_btn.setFixedWidth(180)
 
+        # 批量合并按钮
+        self.batch_button = QtWidgets.QPushButton("批量合并")
+        self.batch_button.setCursor(Qt.PointingHandCursor)
+        self.batch_button.setToolTip("用同一个数据文件填充多个目标文件")
+        self.batch_button.setFixedWidth(100)
+
         # 4. 查看日志按钮
         self.show_log_btn = QtWidgets.QPushButton("查看操作日志")
         self.show_log_btn.setCursor(Qt.PointingHandCursor)
@@ -192,12 +781,21 @@ class ExcelMergerApp(QMainWindow):
 
         # 按钮布局排列
         btn_main_layout.addWidget(self.run_button)
+        btn_main_layout.addWidget(self.cancel_button)
+        btn_main_layout.addWidget(self.batch_button)
         btn_main_layout.addWidget(self.copy_all_btn)
         btn_main_layout.addWidget(self.save_to_excel_btn)
         btn_main_layout.addWidget(self.show_log_btn)
 
         main_layout.addLayout(btn_main_layout)
 
+        # 合并进度条
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setRange(0, 1)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("%v / %m 个工作表")
+        main_layout.addWidget(self.progress_bar)
+
         # ---------------------- 合并结果预览区域（重点保留） ----------------------
         # 预览标题 + 快捷键提示 水平布局
         preview_header_layout = QtWidgets.QHBoxLayout()
@@ -211,15 +809,23 @@ class ExcelMergerApp(QMainWindow):
         self.shortcut_label = QtWidgets.QLabel("快捷键：Ctrl+A 全选 | Ctrl+C 复制选中内容")
         self.shortcut_label.setStyleSheet("color: #666; font-size: 12px;")
 
+        # 预览工作表选择
+        self.sheet_selector = QtWidgets.QComboBox()
+        self.sheet_selector.setMinimumWidth(160)
+        self.sheet_selector.setToolTip("选择要预览的工作表")
+
         # 标题居左，快捷键居右
         preview_header_layout.addWidget(self.preview_label)
+        preview_header_layout.addWidget(self.sheet_selector)
         preview_header_layout.addStretch(1)
         preview_header_layout.addWidget(self.shortcut_label)
 
         main_layout.addLayout(preview_header_layout)
 
         # 合并结果预览表格（核心组件，确保完整保留）
-        self.table_preview = QtWidgets.QTableWidget()
+        self.table_model = DataFrameModel(parent=self)
+        self.table_preview = QtWidgets.QTableView()
+        self.table_preview.setModel(self.table_model)
         self.table_preview.setEditTriggers(QAbstractItemView.NoEditTriggers)
         self.table_preview.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.table_preview.setSelectionBehavior(QAbstractItemView.SelectItems)
@@ -228,7 +834,7 @@ class ExcelMergerApp(QMainWindow):
         self.table_preview.setShowGrid(True)
         self.table_preview.setGridStyle(Qt.PenStyle.DotLine)
         self.table_preview.setStyleSheet("""
-            QTableWidget {
+            QTableView {
                 border: 1px solid #E0E0E0;
                 border-radius: 4px;
                 gridline-color: #F0F0F0;
@@ -242,29 +848,30 @@ class ExcelMergerApp(QMainWindow):
                 padding: 8px 12px;
                 text-align: center;
             }
-            QTableWidget::item {
+            QTableView::item {
                 padding: 6px 12px;
                 border: 1px solid #F0F0F0;
                 font-size: 10.5px;
                 color: #444444;
             }
-            QTableWidget::item:even {
+            QTableView::item:even {
                 background-color: #FFFFFF;
             }
-            QTableWidget::item:odd {
+            QTableView::item:odd {
                 background-color: #FAFBFF;
             }
-            QTableWidget::item:selected {
+            QTableView::item:selected {
                 background-color: #D4E6FC;
                 color: #1A56DB;
             }
         """)
 
-        # 表头设置
+        # 表头设置：列宽按样本行估算，行高固定，避免按全部内容测量
         self.table_preview.horizontalHeader().setStretchLastSection(True)
         self.table_preview.horizontalHeader().setSectionResizeMode(
-            QtWidgets.QHeaderView.ResizeToContents
+            QtWidgets.QHeaderView.Interactive
         )
+        self.table_preview.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
 
         # 表格占据主窗口大部分空间（权重1），确保足够大
         main_layout.addWidget(self.table_preview, 1)
@@ -282,6 +889,14 @@ class ExcelMergerApp(QMainWindow):
 
         # 合并按钮
         self.run_button.clicked.connect(self.run_merge)
+        self.cancel_button.clicked.connect(self.cancel_merge)
+        self.batch_button.clicked.connect(self.open_batch_dialog)
+        # clicked 会把 checked 传给第一个位置参数，用 lambda 以默认参数同时识别两侧
+        self.detect_header_btn.clicked.connect(lambda: self.detect_header_rows())
+
+        # 列映射
+        self.add_mapping_btn.clicked.connect(self.add_mapping_row)
+        self.remove_mapping_btn.clicked.connect(self.remove_mapping_rows)
 
         # 日志相关
         self.log_update_signal.connect(self.update_log)
@@ -289,6 +904,7 @@ class ExcelMergerApp(QMainWindow):
 
         # 表格更新
         self.update_table_signal.connect(self.update_table_preview)
+        self.sheet_selector.currentTextChanged.connect(self.preview_sheet)
 
         # 复制与保存按钮
         self.copy_all_btn.clicked.connect(self.copy_all_table)
@@ -305,6 +921,40 @@ class ExcelMergerApp(QMainWindow):
         log_dialog = LogDialog(self, self.log_buffer)
         log_dialog.exec_()
 
+    def open_batch_dialog(self):
+        """打开批量合并对话框（非模态，可同时查看主窗口日志）"""
+        if self.batch_dialog is None:
+            self.batch_dialog = BatchMergeDialog(self)
+        self.batch_dialog.show()
+        self.batch_dialog.raise_()
+
+    def add_mapping_row(self):
+        """在附加列映射表中添加一行并进入编辑"""
+        row = self.mapping_table.rowCount()
+        self.mapping_table.insertRow(row)
+        self.mapping_table.setItem(row, 0, QTableWidgetItem(""))
+        self.mapping_table.setItem(row, 1, QTableWidgetItem(""))
+        self.mapping_table.editItem(self.mapping_table.item(row, 0))
+
+    def remove_mapping_rows(self):
+        """删除选中的附加列映射"""
+        rows = sorted({index.row() for index in self.mapping_table.selectedIndexes()}, reverse=True)
+        for row in rows:
+            self.mapping_table.removeRow(row)
+
+    def mapping_pairs(self):
+        """读取附加列映射表，返回 [(来源列, 待填列)]；有未填完整的行时返回 None"""
+        pairs = []
+        for row in range(self.mapping_table.rowCount()):
+            texts = [(self.mapping_table.item(row, col).text().strip() if self.mapping_table.item(row, col) else "")
+                     for col in range(2)]
+            if not any(texts):
+                continue
+            if not all(texts):
+                return None
+            pairs.append(tuple(texts))
+        return pairs
+
     def browse_first_file(self):
         """浏览并选择目标文件"""
         options = QtWidgets.QFileDialog.Options()
@@ -316,42 +966,85 @@ class ExcelMergerApp(QMainWindow):
             self.first_file_input.setText(file_path)
             log_msg = f"已选择目标文件：{os.path.basename(file_path)}"
             self.log_update_signal.emit(log_msg)
+            self.detect_header_rows(source=False)
 
     def browse_second_file(self):
-        """浏览并选择数据文件"""
+        """浏览并选择一个或多个数据文件（按选择顺序排列，后面的文件优先）"""
         options = QtWidgets.QFileDialog.Options()
         options |= QtWidgets.QFileDialog.ReadOnly
-        file_path, _ = QtWidgets.QFileDialog.getOpenFileName(
+        file_paths, _ = QtWidgets.QFileDialog.getOpenFileNames(
             self, "选择数据文件", "", "Excel文件 (*.xlsx);;所有文件 (*)", options=options
         )
-        if file_path:
-            self.second_file_input.setText(file_path)
-            log_msg = f"已选择数据文件：{os.path.basename(file_path)}"
+        if file_paths:
+            self.second_file_input.setText(DATA_FILE_SEPARATOR.join(file_paths))
+            log_msg = f"已选择数据文件：{'、'.join(os.path.basename(p) for p in file_paths)}"
             self.log_update_signal.emit(log_msg)
-
-    def run_merge(self):
-        """执行数据合并操作"""
+            self.detect_header_rows(target=False)
+
+    def detect_header_rows(self, target=True, source=True):
+        """按当前填写的列名识别目标文件/数据文件的列名行号，并更新行号输入框"""
+        jobs = []
+        if target:
+            first_file = self.first_file_input.text().strip()
+            columns = [*split_column_names(self.first_col_name_input.text()), self.first_data_col_input.text().strip()]
+            jobs.append(("目标文件", [first_file] if first_file else [], columns, self.first_row_input))
+        if source:
+            second_files = [p.strip() for p in self.second_file_input.text().split(DATA_FILE_SEPARATOR) if p.strip()]
+            columns = [*split_column_names(self.second_col_name_input.text()), self.second_data_col_input.text().strip()]
+            jobs.append(("数据文件", second_files, columns, self.second_row_input))
+
+        for role, files, columns, spin_box in jobs:
+            columns = [c for c in columns if c]
+            if not columns:
+                continue
+            detected = {}
+            for file_path in files:
+                if not os.path.exists(file_path):
+                    continue
+                try:
+                    header_row, from_cache = detect_header_row(file_path, columns)
+                except Exception as e:
+                    self.log_update_signal.emit(f"{role} {os.path.basename(file_path)} 列名行号识别失败：{e}")
+                    continue
+                if header_row is None:
+                    self.log_update_signal.emit(
+                        f"{role} {os.path.basename(file_path)} 的前几行中未找到列 {'、'.join(columns)}，请手动设置列名行号")
+                    continue
+                detected[file_path] = header_row
+                source_text = "（同模板缓存）" if from_cache else ""
+                self.log_update_signal.emit(
+                    f"{role} {os.path.basename(file_path)} 识别到列名行号：第 {header_row + 1} 行{source_text}")
+
+            if detected:
+                header_row = next(iter(detected.values()))
+                spin_box.setValue(header_row + 1)
+                if len(set(detected.values())) > 1:
+                    self.log_update_signal.emit(f"提示：多个{role}的列名行号不一致，已按第一个文件设置为第 {header_row + 1} 行")
+
+    def collect_options(self, first_file=None):
+        """读取并校验界面参数，返回 MergeOptions；参数无效时记录错误并返回 None
+
+        first_file 为 None 时使用界面上的目标文件（批量合并时逐个传入目标文件）。
+        """
         # 获取输入参数
-        first_file = self.first_file_input.text().strip()
-        second_file = self.second_file_input.text().strip()
+        check_target = first_file is None
+        if check_target:
+            first_file = self.first_file_input.text().strip()
+        second_files = tuple(p.strip() for p in self.second_file_input.text().split(DATA_FILE_SEPARATOR) if p.strip())
 
         # 校验文件路径
-        if not first_file or not os.path.exists(first_file):
+        if check_target and (not first_file or not os.path.exists(first_file)):
             error_msg = "错误：请选择有效的目标文件！"
             self.log_update_signal.emit(error_msg)
-            return
-        if not second_file or not os.path.exists(second_file):
+            return None
+        if not second_files or not all(os.path.exists(p) for p in second_files):
             error_msg = "错误：请选择有效的数据文件！"
             self.log_update_signal.emit(error_msg)
-            return
-
-        # 转换行号（输入行号-1）
-        first_row = self.first_row_input.value() - 1
-        second_row = self.second_row_input.value() - 1
+            return None
 
         # 获取列名参数
-        m_id1 = self.first_col_name_input.text().strip()
-        m_id2 = self.second_col_name_input.text().strip()
+        m_id1 = split_column_names(self.first_col_name_input.text())
+        m_id2 = split_column_names(self.second_col_name_input.text())
         m_price = self.first_data_col_input.text().strip()
         m_price2 = self.second_data_col_input.text().strip()
 
@@ -359,134 +1052,163 @@ class ExcelMergerApp(QMainWindow):
         if not all([m_id1, m_id2, m_price, m_price2]):
             error_msg = "错误：请填写完整的列名参数！"
             self.log_update_signal.emit(error_msg)
-            return
-
-        try:
-            # 读取目标文件
-            log_msg = "正在读取目标文件..."
-            self.log_update_signal.emit(log_msg)
-
-            test1_xls = pd.ExcelFile(first_file)
-            sheet_names = test1_xls.sheet_names
-            log_msg = f"目标文件包含 {len(sheet_names)} 个工作表"
-            self.log_update_signal.emit(log_msg)
-
-            # 处理每个工作表
-            for idx, sheet_name in enumerate(sheet_names, 1):
-                log_msg = f"正在处理工作表 {idx}/{len(sheet_names)}：{sheet_name}"
-                self.log_update_signal.emit(log_msg)
-
-                # 读取目标工作表数据
-                test1_df = test1_xls.parse(sheet_name, header=first_row)
-                if test1_df.empty:
-                    log_msg = f"警告：{sheet_name} 为空，已跳过"
-                    self.log_update_signal.emit(log_msg)
-                    continue
-
-                # 清理列名空格
-                test1_df.columns = test1_df.columns.str.strip()
-
-                # 读取数据文件所有工作表并合并
-                log_msg = "正在读取数据文件工作表..."
-                self.log_update_signal.emit(log_msg)
-
-                test2_xls = pd.ExcelFile(second_file)
-                merged_df1 = pd.DataFrame(columns=[m_id1, m_price2])
-
-                for sheet_name2 in test2_xls.sheet_names:
-                    test2_df = pd.read_excel(test2_xls, sheet_name2, header=second_row)
-                    test2_df.columns = test2_df.columns.str.strip()
-
-                    # 校验数据文件列名
-                    if m_id2 not in test2_df.columns or m_price2 not in test2_df.columns:
-                        error_msg = f"错误：数据文件工作表 {sheet_name2} 缺少列 {m_id2} 或 {m_price2}"
-                        self.log_update_signal.emit(error_msg)
-                        return
-
-                    merged_df1 = pd.concat([merged_df1, test2_df[[m_id2, m_price2]]], ignore_index=True)
-
-                # 校验目标文件列名
-                if m_id1 not in test1_df.columns or m_price not in test1_df.columns:
-                    error_msg = f"错误：目标工作表 {sheet_name} 缺少列 {m_id1} 或 {m_price}"
-                    self.log_update_signal.emit(error_msg)
-                    return
-
-                # 合并数据
-                log_msg = f"正在合并 {sheet_name} 数据..."
-                self.log_update_signal.emit(log_msg)
-
-                merged_df1.rename(columns={m_id2: m_id1}, inplace=True)  # 统一匹配列名
-                merged_df_final = test1_df.merge(merged_df1, on=m_id1, how='left')
-
-                # 更新价格列
-                test1_df[m_price] = merged_df_final[m_price2]
+            return None
+        extra_pairs = self.mapping_pairs()
+        if extra_pairs is None:
+            error_msg = "错误：附加列映射中有未填写完整的行！"
+            self.log_update_signal.emit(error_msg)
+            return None
+        column_pairs = ((m_price2, m_price), *extra_pairs)
+        target_cols = [dst for _, dst in column_pairs]
+        if len(set(target_cols)) != len(target_cols):
+            error_msg = "错误：同一个待填列被映射了多次！"
+            self.log_update_signal.emit(error_msg)
+            return None
+        if len(m_id1) != len(m_id2):
+            error_msg = f"错误：目标文件匹配列（{len(m_id1)} 个）与数据文件匹配列（{len(m_id2)} 个）数量不一致！"
+            self.log_update_signal.emit(error_msg)
+            return None
+
+        return MergeOptions(
+            target_file=first_file,
+            source_files=second_files,
+            # 转换行号（输入行号-1）
+            target_header_row=self.first_row_input.value() - 1,
+            source_header_row=self.second_row_input.value() - 1,
+            target_keys=m_id1,
+            source_keys=m_id2,
+            column_pairs=column_pairs,
+            normalize_keys=self.normalize_checkbox.isChecked(),
+            use_cache=self.cache_checkbox.isChecked(),
+            duplicate_policy=self.duplicate_policy_input.currentData(),
+            source_mode=self.source_mode_input.currentData(),
+            compact_dtypes=self.compact_checkbox.isChecked(),
+        )
 
-                log_msg = f"{sheet_name} 处理完成"
-                self.log_update_signal.emit(log_msg)
+    def run_merge(self):
+        """校验参数并在后台线程中启动合并"""
+        if self.merge_thread is not None:
+            self.log_update_signal.emit("提示：合并正在进行中，请稍候或先取消")
+            return
 
-                # 更新当前合并结果并刷新表格预览（关键：确保预览表格被更新）
-                self.current_merged_df = test1_df.copy()
-                self.update_table_signal.emit(self.current_merged_df)
+        options = self.collect_options()
+        if options is None:
+            return
 
-            log_msg = "✅ 所有工作表处理完成！"
-            self.log_update_signal.emit(log_msg)
+        # 创建后台线程与任务
+        self.merge_thread = QtCore.QThread(self)
+        self.merge_worker = MergeWorker(options)
+        self.merge_worker.moveToThread(self.merge_thread)
+
+        self.merge_thread.started.connect(self.merge_worker.run)
+        self.merge_worker.log_signal.connect(self.log_update_signal)
+        self.merge_worker.progress_signal.connect(self.update_progress)
+        self.merge_worker.sheet_done_signal.connect(self.on_sheet_done)
+        self.merge_worker.lookup_ready_signal.connect(self.on_lookup_ready)
+        self.merge_worker.finished_signal.connect(self.merge_thread.quit)
+        self.merge_worker.finished_signal.connect(self.merge_worker.deleteLater)
+        self.merge_thread.finished.connect(self.on_merge_finished)
+
+        # 清空上一次的合并结果
+        self.merged_sheets = {}
+        self.sheet_stats = {}
+        self.report_views = {}
+        self.merge_options = options
+        self.merge_lookup = None
+        self.current_merged_df = None
+        self.sheet_selector.clear()
+
+        self.set_merge_running(True)
+        self.merge_thread.start()
+
+    def cancel_merge(self):
+        """请求取消正在进行的合并（当前工作表处理完后停止）"""
+        if self.merge_worker is not None:
+            self.merge_worker.cancel()
+            self.cancel_button.setEnabled(False)
+            self.log_update_signal.emit("正在取消合并...")
+
+    def set_merge_running(self, running):
+        """切换合并进行中/空闲时的按钮与进度条状态"""
+        self.run_button.setEnabled(not running)
+        self.cancel_button.setEnabled(running)
+        if running:
+            self.progress_bar.setRange(0, 0)  # 读取数据文件期间显示忙碌状态
+            self.progress_bar.setValue(0)
+
+    def update_progress(self, done, total):
+        """更新合并进度条"""
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+
+    def on_lookup_ready(self, lookup):
+        """保存查找表，供原格式写回使用"""
+        self.merge_lookup = lookup
+
+    def on_sheet_done(self, sheet_name, df, stats):
+        """单个工作表处理完成后保存结果并切换预览到该工作表"""
+        self.merged_sheets[sheet_name] = df
+        self.sheet_stats[sheet_name] = stats
+        self.sheet_selector.addItem(sheet_name)
+        self.sheet_selector.setCurrentText(sheet_name)
+
+    def preview_sheet(self, sheet_name):
+        """预览指定工作表的合并结果"""
+        df = self.merged_sheets.get(sheet_name)
+        if df is None:
+            df = self.report_views.get(sheet_name)
+        if df is None:
+            return
+        self.current_merged_df = df
+        self.update_table_signal.emit(df)
+
+    def on_merge_finished(self):
+        """后台线程结束后的清理工作"""
+        self.merge_thread.deleteLater()
+        self.merge_thread = None
+        self.merge_worker = None
+        self.set_merge_running(False)
+        if self.progress_bar.maximum() == 0:
+            self.progress_bar.setRange(0, 1)
+        self.show_match_report()
+
+    def show_match_report(self):
+        """根据各工作表的匹配统计生成“匹配汇总”与“未匹配键”视图，加入预览下拉框"""
+        if not self.sheet_stats:
+            return
+        summary = build_match_summary(self.sheet_stats)
+        unmatched = build_unmatched_report(self.sheet_stats)
+        self.report_views = {MATCH_SUMMARY_VIEW: summary, UNMATCHED_KEYS_VIEW: unmatched}
+        self.sheet_selector.addItems(list(self.report_views))
+
+        total = summary.iloc[-1]
+        log_msg = (f"匹配汇总：共 {total['总行数']} 行，已匹配 {total['已匹配']} 行，未匹配 {total['未匹配']} 行"
+                   f"（未匹配键 {len(unmatched)} 条），匹配率 {total['匹配率']}；可在预览中选择“{UNMATCHED_KEYS_VIEW}”查看")
+        self.log_update_signal.emit(log_msg)
 
-        except KeyError as e:
-            error_msg = f"错误（KeyError）：{str(e)}，请检查列名参数"
-            self.log_update_signal.emit(error_msg)
-        except pd.errors.EmptyDataError:
-            error_msg = "错误：读取的文件为空，请检查文件有效性"
-            self.log_update_signal.emit(error_msg)
-        except Exception as e:
-            error_msg = f"未知错误：{str(e)}"
-            self.log_update_signal.emit(error_msg)
-        finally:
-            # 确保文件被关闭
-            if 'test1_xls' in locals() and test1_xls:
-                test1_xls.close()
-            if 'test2_xls' in locals() and test2_xls:
-                test2_xls.close()
+    def closeEvent(self, event):
+        """关闭窗口时取消并等待后台合并结束"""
+        if self.merge_thread is not None:
+            self.merge_worker.cancel()
+            self.merge_thread.quit()
+            self.merge_thread.wait()
+        if self.save_thread is not None:
+            self.save_thread.wait()  # 写回无法中途取消，等待保存完成以免留下不完整的文件
+        if self.batch_dialog is not None:
+            self.batch_dialog.close()
+        super().closeEvent(event)
 
     def update_table_preview(self, df):
         """更新合并结果预览表格（核心方法）"""
-        # 清空表格
-        self.table_preview.setRowCount(0)
-        self.table_preview.setColumnCount(0)
-
-        # 设置列名
-        columns = list(df.columns)
-        self.table_preview.setColumnCount(len(columns))
-        self.table_preview.setHorizontalHeaderLabels(columns)
-
-        # 设置行数据
-        row_count = len(df)
-        self.table_preview.setRowCount(row_count)
-
-        # 填充数据
-        for row_idx in range(row_count):
-            for col_idx in range(len(columns)):
-                cell_value = df.iloc[row_idx, col_idx]
-
-                # 处理单元格值
-                if pd.isna(cell_value):
-                    cell_text = ""
-                elif col_idx == 0 and isinstance(cell_value, (int, float)):
-                    cell_text = f"{int(cell_value)}"
-                elif isinstance(cell_value, (int, float)):
-                    cell_text = f"{cell_value:.2f}"
-                else:
-                    cell_text = str(cell_value)
-
-                # 创建表格项并设置
-                item = QTableWidgetItem(cell_text)
-                if isinstance(cell_value, (int, float)) and not pd.isna(cell_value):
-                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-                else:
-                    item.setTextAlignment(Qt.AlignCenter)
-                self.table_preview.setItem(row_idx, col_idx, item)
+        self.table_model.set_dataframe(df)
+
+        # 按样本行设置列宽
+        widths = self.table_model.sample_column_widths(self.table_preview.fontMetrics())
+        for col_idx, width in enumerate(widths):
+            self.table_preview.setColumnWidth(col_idx, width)
 
         # 日志提示
-        log_msg = f"表格预览已更新：{row_count} 行 × {len(columns)} 列"
+        log_msg = f"表格预览已更新：{len(df)} 行 × {len(df.columns)} 列"
         self.log_update_signal.emit(log_msg)
 
     def update_log(self, message):
@@ -512,8 +1234,8 @@ class ExcelMergerApp(QMainWindow):
 
     def copy_selected(self):
         """复制选中的单元格、行或列（复制整列时不包含列名）"""
-        selected_items = self.table_preview.selectedItems()
-        if not selected_items:
+        selected_indexes = self.table_preview.selectionModel().selectedIndexes()
+        if not selected_indexes:
             msg = "提示：请先选中要复制的内容"
             self.log_update_signal.emit(msg)
             return
@@ -525,12 +1247,12 @@ class ExcelMergerApp(QMainWindow):
         max_col = -float('inf')
 
         # 1. 收集选中数据的行列范围
-        for item in selected_items:
-            row = item.row()
-            col = item.column()
+        for index in selected_indexes:
+            row = index.row()
+            col = index.column()
             if row not in data:
                 data[row] = {}
-            data[row][col] = item.text()
+            data[row][col] = index.data()
 
             min_row = min(min_row, row)
             max_row = max(max_row, row)
@@ -559,8 +1281,8 @@ class ExcelMergerApp(QMainWindow):
         self.log_update_signal.emit(msg)
 
     def save_to_excel(self):
-        """将当前预览的表格数据保存为Excel文件"""
-        if self.current_merged_df is None or self.current_merged_df.empty:
+        """将所有已处理工作表的合并结果保存为Excel文件（保留原工作表名）"""
+        if not self.merged_sheets:
             msg = "提示：无数据可保存（表格为空）"
             self.log_update_signal.emit(msg)
             return
@@ -569,21 +1291,54 @@ class ExcelMergerApp(QMainWindow):
         if not os.path.exists(default_dir):
             default_dir = os.path.expanduser("~")
 
+        if self.save_thread is not None:
+            self.log_update_signal.emit("提示：正在保存，请稍候")
+            return
+
+        # 原格式写回时沿用目标文件的扩展名（.xlsm 需保留宏）
+        in_place = self.inplace_checkbox.isChecked() and self.merge_lookup is not None
+        ext = output_extension(self.merge_options.target_file, in_place)
         file_path, _ = QFileDialog.getSaveFileName(
-            self, "保存Excel文件", default_dir, "Excel文件 (*.xlsx);;所有文件 (*)"
+            self, "保存Excel文件", default_dir, f"Excel文件 (*{ext});;所有文件 (*)"
         )
 
         if file_path:
             try:
-                if not file_path.endswith('.xlsx'):
-                    file_path += '.xlsx'
-                self.current_merged_df.to_excel(file_path, index=False)
-                msg = f"✅ 数据已成功保存到：{file_path}"
+                if not file_path.lower().endswith(ext.lower()):
+                    file_path += ext
+                if in_place:
+                    self.save_in_place(file_path)
+                    return
+                write_sheets(file_path, self.merged_sheets)
+                msg = f"✅ {len(self.merged_sheets)} 个工作表已成功保存到：{file_path}"
                 self.log_update_signal.emit(msg)
             except Exception as e:
                 error_msg = f"保存失败：{str(e)}"
                 self.log_update_signal.emit(error_msg)
 
+    def save_in_place(self, file_path):
+        """在后台线程中以目标文件为模板只改写待填列后另存（保留原格式）"""
+        self.save_thread = QtCore.QThread(self)
+        self.save_worker = SaveInPlaceWorker(self.merge_options, self.merge_lookup, file_path)
+        self.save_worker.moveToThread(self.save_thread)
+
+        self.save_thread.started.connect(self.save_worker.run)
+        self.save_worker.log_signal.connect(self.log_update_signal)
+        self.save_worker.finished_signal.connect(self.save_thread.quit)
+        self.save_worker.finished_signal.connect(self.save_worker.deleteLater)
+        self.save_thread.finished.connect(self.on_save_finished)
+
+        self.save_to_excel_btn.setEnabled(False)
+        self.log_update_signal.emit("正在按目标文件原格式保存...")
+        self.save_thread.start()
+
+    def on_save_finished(self):
+        """原格式写回线程结束后的清理工作"""
+        self.save_thread.deleteLater()
+        self.save_thread = None
+        self.save_worker = None
+        self.save_to_excel_btn.setEnabled(True)
+
 
 def main():
     """主函数"""
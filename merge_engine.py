@@ -0,0 +1,1109 @@
+"""Excel合并工具的数据处理核心（不依赖Qt，可在后台线程或子进程中调用）"""
+import datetime
+import os
+import re
+import sqlite3
+import tempfile
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor, wait
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from app_cache import DiskCache, cache_dir, file_signature, make_key
+
+
+class MergeError(Exception):
+    """合并过程中的可预期错误（列名缺失等），消息可直接展示给用户"""
+
+
+class MergeCancelled(MergeError):
+    """用户取消了合并"""
+
+    def __init__(self, message="⚠️ 合并已取消"):
+        super().__init__(message)
+
+
+@dataclass
+class MergeOptions:
+    """一次合并任务的全部参数（行号均为从0开始的表头行）"""
+    target_file: str
+    source_files: tuple  # 一个或多个数据文件，按优先级从低到高排列（后面的文件覆盖前面的）
+    target_header_row: int = 2
+    source_header_row: int = 0
+    target_keys: tuple = ("商品名称",)  # 一个或多个匹配列，多列时按元组整体匹配
+    source_keys: tuple = ("商品名称",)
+    column_pairs: tuple = (("TG", "价格"),)  # (数据文件来源列, 目标文件待填列) 映射，一次读取全部填充
+    normalize_keys: bool = False  # 匹配前标准化键（空白、全半角、大小写、数字编码）
+    use_cache: bool = True  # 复用磁盘上已解析的数据文件列
+    duplicate_policy: str = "first"  # 数据文件中重复键的处理方式，见 DUPLICATE_POLICIES
+    source_mode: str = "memory"  # 数据文件读取方式，见 SOURCE_MODES
+    compact_dtypes: bool = True  # 整数列向下转换、重复字符串列转换为 category，降低内存占用
+
+    @property
+    def source_cols(self):
+        return list(dict.fromkeys(src for src, _ in self.column_pairs))
+
+    @property
+    def target_cols(self):
+        return [dst for _, dst in self.column_pairs]
+
+
+@dataclass
+class SourceInfo:
+    """数据文件读取情况"""
+    files: int = 0
+    sheets: int = 0
+    rows: int = 0
+    cached_files: int = 0  # 直接使用磁盘缓存的文件数
+
+    @property
+    def from_cache(self):
+        return self.files > 0 and self.cached_files == self.files
+
+
+@dataclass
+class MatchStats:
+    """单个工作表的匹配统计"""
+    matched: int = 0
+    unmatched: int = 0  # 含空键行
+    by_source: dict = field(default_factory=dict)  # 多个数据文件时，各文件提供的匹配行数
+    blank: int = 0  # 匹配列为空的行数
+    duplicate: int = 0  # 键在本表中出现多次的行数
+    unmatched_keys: pd.DataFrame = None  # 未匹配的键：[匹配列..., 出现次数, 预览行号]，按首次出现排序
+
+    @property
+    def total(self):
+        return self.matched + self.unmatched
+
+    @property
+    def match_rate(self):
+        return self.matched / self.total if self.total else 0.0
+
+
+UNMATCHED_COUNT_COLUMN = "出现次数"
+UNMATCHED_ROW_COLUMN = "预览行号"  # 键首次出现的行（与预览表格的行号一致）
+
+
+def summarize_matches(df, key_cols, index, valid, positions):
+    """由目标键索引与查找位置统计匹配情况（factorize + bincount，无逐行循环），返回 MatchStats
+
+    空键不参与重复与未匹配键的统计；未匹配键按首次出现顺序列出原始键值。
+    """
+    codes = np.where(valid, index.factorize()[0], -1)
+    counts = np.bincount(codes[valid], minlength=codes.max() + 1 if len(codes) else 0)
+    matched = int((positions >= 0).sum())
+    stats = MatchStats(matched=matched, unmatched=len(positions) - matched, blank=int((~valid).sum()),
+                       duplicate=int((counts[codes[valid]] > 1).sum()))
+
+    missing_rows = np.flatnonzero(valid & (positions < 0))
+    missing_codes, first = np.unique(codes[missing_rows], return_index=True)
+    order = np.argsort(first)
+    rows = missing_rows[first[order]]
+    unmatched_keys = df.iloc[rows][list(key_cols)].astype(object).reset_index(drop=True)
+    unmatched_keys[UNMATCHED_COUNT_COLUMN] = counts[missing_codes[order]]
+    unmatched_keys[UNMATCHED_ROW_COLUMN] = rows + 1
+    stats.unmatched_keys = unmatched_keys
+    return stats
+
+
+def build_match_summary(sheet_stats):
+    """各工作表匹配统计汇总表（末行为合计）"""
+    rows = [(name, st.total, st.matched, st.unmatched, st.blank, st.duplicate) for name, st in sheet_stats.items()]
+    summary = pd.DataFrame(rows, columns=["工作表", "总行数", "已匹配", "未匹配", "其中空键", "重复键行"])
+    total = summary.iloc[:, 1:].sum()
+    summary.loc[len(summary)] = ["合计", *total.tolist()]
+    summary["匹配率"] = (summary["已匹配"] / summary["总行数"].where(summary["总行数"] > 0)).map(
+        lambda rate: "" if pd.isna(rate) else f"{rate:.1%}")
+    return summary
+
+
+def build_unmatched_report(sheet_stats):
+    """把各工作表的未匹配键拼接为一张表（首列为工作表名）"""
+    frames = []
+    for name, st in sheet_stats.items():
+        if st.unmatched_keys is not None and len(st.unmatched_keys):
+            frames.append(st.unmatched_keys.assign(工作表=name))
+    if not frames:
+        return pd.DataFrame(columns=["工作表", UNMATCHED_COUNT_COLUMN, UNMATCHED_ROW_COLUMN])
+    report = pd.concat(frames, ignore_index=True)
+    return report[["工作表", *[c for c in report.columns if c != "工作表"]]]
+
+
+def split_column_names(text):
+    """把“商品名称,规格,单位”形式的输入拆成列名元组（支持中英文逗号）"""
+    return tuple(name.strip() for name in re.split(r"[,，]", text) if name.strip())
+
+
+def describe_columns(columns):
+    return "、".join(str(c) for c in columns)
+
+
+def normalize_keys(keys):
+    """把匹配键转换为标准形式（向量化字符串运算）
+
+    依次做 NFKC 规范化（全角转半角）、去除首尾空白并合并内部空白、大小写折叠，
+    并统一数字编码：1.0 -> 1，001 -> 1。空值保持为 NaN。
+    """
+    keys = pd.Series(keys, dtype=object)
+    missing = keys.isna()
+    text = keys.astype(str).str.normalize('NFKC')
+    text = text.str.strip().str.replace(r'\s+', ' ', regex=True).str.casefold()
+    text = text.str.replace(r'^(\d+)\.0*$', r'\1', regex=True)
+    text = text.str.replace(r'^0+(?=\d+(?:\.\d+)?$)', '', regex=True)
+    return text.where(~missing).to_numpy(dtype=object)
+
+
+def build_key_index(key_columns, normalize=False):
+    """由一个或多个匹配列构建键索引
+
+    单列返回普通 Index；多列返回 MultiIndex，按元组哈希整体匹配。
+    返回 (索引, 有效键掩码)：单列时空值无效；多列时全部为空才无效，部分为空按空串参与匹配。
+    """
+    arrays = [pd.Series(normalize_keys(c) if normalize else np.asarray(c, dtype=object), dtype=object)
+              for c in key_columns]
+    if len(arrays) == 1:
+        return pd.Index(arrays[0], dtype=object), arrays[0].notna().to_numpy()
+    valid = ~np.logical_and.reduce([a.isna().to_numpy() for a in arrays])
+    return pd.MultiIndex.from_arrays([a.fillna("") for a in arrays]), valid
+
+
+SOURCE_FILE_COLUMN = "数据来源文件"  # 多个数据文件时，结果中记录每行取值来源的列
+
+# 重复键处理策略：策略名 -> 显示名称
+DUPLICATE_POLICIES = {
+    "first": "保留第一个",
+    "last": "保留最后一个",
+    "mean": "数值取平均",
+    "error": "取值冲突时报错",
+}
+MAX_DUPLICATE_EXAMPLES = 20
+
+
+@dataclass
+class DuplicateReport:
+    """数据文件中重复键的扫描结果"""
+    duplicate_keys: int = 0  # 出现多次的键数
+    duplicate_rows: int = 0  # 这些键涉及的行数
+    conflict_keys: int = 0  # 多次出现且取值不一致的键数
+    examples: list = field(default_factory=list)  # [(文件名, 键, [各次取值])]，最多 MAX_DUPLICATE_EXAMPLES 个
+
+    def merge(self, other):
+        self.duplicate_keys += other.duplicate_keys
+        self.duplicate_rows += other.duplicate_rows
+        self.conflict_keys += other.conflict_keys
+        self.examples.extend(other.examples[:MAX_DUPLICATE_EXAMPLES - len(self.examples)])
+
+    def describe(self, policy):
+        """重复键报告的文本行"""
+        lines = [f"数据文件中有 {self.duplicate_keys} 个重复键（共 {self.duplicate_rows} 行），"
+                 f"其中 {self.conflict_keys} 个取值不一致，处理方式：{DUPLICATE_POLICIES.get(policy, policy)}"]
+        for label, key, values in self.examples:
+            lines.append(f"  {label + '：' if label else ''}{key} -> {' / '.join(map(str, values))}")
+        if self.conflict_keys > len(self.examples):
+            lines.append(f"  …… 另有 {self.conflict_keys - len(self.examples)} 个冲突键未列出")
+        return lines
+
+
+def format_key(key):
+    return "|".join(map(str, key)) if isinstance(key, tuple) else str(key)
+
+
+def resolve_duplicates(index, values, policy="first", label=""):
+    """按策略合并重复键，返回 (唯一键索引, 对应取值, DuplicateReport)
+
+    先 factorize 键再按编号计数与分组，整体为向量化运算。取值不一致的键记入冲突；
+    policy 为 "error" 且存在冲突时抛出 MergeError。
+    """
+    values = values.reset_index(drop=True)
+    codes, uniques = index.factorize()
+    counts = np.bincount(codes, minlength=len(uniques))
+    dup_codes = np.flatnonzero(counts > 1)
+    report = DuplicateReport(duplicate_keys=len(dup_codes), duplicate_rows=int(counts[dup_codes].sum()))
+
+    if len(dup_codes):
+        in_dup = np.isin(codes, dup_codes)
+        # 空值也算一种取值（与磁盘索引的 COALESCE(..., 'nan') 一致）：空值与非空值并存即为冲突
+        distinct = values[in_dup].astype(str).groupby(codes[in_dup]).nunique(dropna=False).max(axis=1)
+        conflict_codes = distinct.index[distinct > 1].to_numpy()
+        report.conflict_keys = len(conflict_codes)
+        for code in conflict_codes[:MAX_DUPLICATE_EXAMPLES]:
+            rows = values[codes == code]
+            shown = rows.iloc[:, 0] if rows.shape[1] == 1 else rows.apply(tuple, axis=1)
+            report.examples.append((label, format_key(uniques[code]), shown.tolist()))
+
+        if policy == "error" and report.conflict_keys:
+            raise MergeError("错误：数据文件中存在取值不一致的重复键\n" + "\n".join(report.describe(policy)))
+
+    if policy == "last":
+        keep = ~index.duplicated(keep='last')
+        return index[keep], values[keep], report
+
+    keep = ~index.duplicated(keep='first')
+    result = values[keep].reset_index(drop=True)
+    if policy == "mean" and len(dup_codes):
+        kept_codes = codes[keep]
+        for col in values.columns:
+            numeric = pd.to_numeric(values[col], errors='coerce')
+            if numeric.notna().sum() == values[col].notna().sum():  # 只对纯数值列取平均，其余保留第一个
+                result[col] = numeric.groupby(codes).mean().reindex(kept_codes).to_numpy()
+    return index[keep], result, report
+
+
+class SourceLookup:
+    """数据文件查找表：以匹配列（或匹配列元组）为键的哈希索引，键唯一，值按位置存放"""
+
+    def __init__(self, keys, values, normalize=False, sources=None, duplicates=None):
+        self.index = keys if isinstance(keys, pd.Index) else pd.Index(keys)
+        self.values = values.reset_index(drop=True)
+        self.normalize = normalize  # 为真时 index 中存放的是标准化后的键
+        self.sources = sources  # 与 values 对齐的来源文件名（Categorical），单个数据文件时为 None
+        self.duplicates = duplicates or DuplicateReport()  # 构建时发现的重复键
+
+    def __len__(self):
+        return len(self.index)
+
+    @classmethod
+    def from_frame(cls, df, key_cols, value_cols, normalize=False, duplicate_policy="first", label=""):
+        """由 [匹配列..., 来源列...] 数据构建查找表；空键丢弃，重复键按 duplicate_policy 处理
+
+        normalize 为真时先把键标准化（见 normalize_keys），只计算一次。
+        """
+        index, valid = build_key_index([df[c] for c in key_cols], normalize)
+        index, values, report = resolve_duplicates(index[valid], df.loc[valid, list(value_cols)],
+                                                   duplicate_policy, label)
+        return cls(index, values, normalize, duplicates=report)
+
+    @classmethod
+    def from_frames(cls, frames, labels, key_cols, value_cols, normalize=False, duplicate_policy="first"):
+        """由多个数据文件的数据构建一个查找表，排在后面的文件优先
+
+        重复键先在每个文件内部按 duplicate_policy 处理；各文件再倒序拼接后按“第一次出现”去重，
+        即后面文件的值覆盖前面文件的同名键。多于一个文件时记录每个值的来源文件（labels 为各文件的显示名）。
+        """
+        if len(frames) == 1:
+            return cls.from_frame(frames[0], key_cols, value_cols, normalize, duplicate_policy)
+        if len(set(labels)) != len(labels):  # 不同目录下的同名文件加序号区分
+            labels = [f"{i + 1}:{label}" for i, label in enumerate(labels)]
+
+        lookups = [cls.from_frame(frame, key_cols, value_cols, normalize, duplicate_policy, label)
+                   for frame, label in zip(frames, labels)]
+        ordered = list(range(len(lookups)))[::-1]
+        index = lookups[ordered[0]].index.append([lookups[i].index for i in ordered[1:]])
+        values = pd.concat([lookups[i].values for i in ordered], ignore_index=True)
+        codes = np.concatenate([np.full(len(lookups[i]), i, dtype=np.int32) for i in ordered])
+        keep = ~index.duplicated(keep='first')
+
+        duplicates = DuplicateReport()
+        for lookup in lookups:
+            duplicates.merge(lookup.duplicates)
+        sources = pd.Categorical.from_codes(codes[keep], categories=labels)
+        return cls(index[keep], values[keep], normalize, sources, duplicates)
+
+    def lookup_positions(self, key_columns):
+        """返回每行键（由各匹配列组成）在查找表中的位置，未匹配为 -1"""
+        return self.index_positions(*build_key_index(key_columns, self.normalize))
+
+    def index_positions(self, index, valid):
+        """返回 build_key_index 得到的键在查找表中的位置，无效键与未匹配为 -1"""
+        positions = self.index.get_indexer(index)
+        positions[~valid] = -1
+        return positions
+
+    def take(self, value_col, positions):
+        """按位置取值，未匹配的位置填充 NaN"""
+        matched = positions >= 0
+        if not len(self.index):
+            return np.full(len(positions), np.nan, dtype=object)
+        values = self.values[value_col].to_numpy()
+        result = pd.Series(values.take(np.where(matched, positions, 0)))
+        return result.where(matched).to_numpy()
+
+    def take_sources(self, positions):
+        """按位置取每行值的来源文件名，未匹配为 NaN"""
+        matched = positions >= 0
+        if not len(self.index):
+            return np.full(len(positions), np.nan, dtype=object)
+        return pd.Series(self.sources.take(np.where(matched, positions, 0))).where(matched).to_numpy()
+
+    def source_counts(self, positions):
+        """统计匹配行分别来自哪个数据文件"""
+        if self.sources is None:
+            return {}
+        counts = pd.Series(self.sources.take(positions[positions >= 0])).value_counts(sort=False)
+        return {str(k): int(v) for k, v in counts.items() if v}
+
+    def fill(self, df, key_cols, column_pairs, with_source=True):
+        """用查找表向量化填充目标列：键只查找一次，各 (来源列, 待填列) 映射共用查找结果，返回匹配统计
+
+        多个数据文件且 with_source 为真时，追加一列记录每行取值的来源文件。
+        """
+        index, valid = build_key_index([df[c] for c in key_cols], self.normalize)
+        positions = self.index_positions(index, valid)
+        stats = summarize_matches(df, key_cols, index, valid, positions)
+        stats.by_source = self.source_counts(positions)
+        for value_col, target_col in column_pairs:
+            df[target_col] = self.take(value_col, positions)
+        if self.sources is not None and with_source:
+            df[SOURCE_FILE_COLUMN] = self.take_sources(positions)
+        return stats
+
+
+COMPACT_MIN_ROWS = 100  # 行数较少的表不做 category 转换
+COMPACT_CATEGORY_RATIO = 0.5  # 不同取值数不超过行数的该比例时转换为 category
+
+
+def compact_frame(df):
+    """返回压缩内存占用后的 DataFrame
+
+    整数列向下转换为能容纳取值的最小整数类型；纯字符串列在重复度高（单位、分类、供应商等）时转换为 category，
+    先用前 COMPACT_MIN_ROWS 行估计重复度，明显不重复的列（如商品名称）不做完整的分解。
+    浮点列保持 float64，避免价格等数值出现 float32 的显示误差。
+    最后复制一次：解析得到的列可能仍引用解析时的整块缓冲，复制后才能释放，压缩后的数据复制代价很小。
+    """
+    df = df.copy(deep=False)
+    for i in range(df.shape[1]):
+        col = df.iloc[:, i]
+        if pd.api.types.is_integer_dtype(col.dtype) and not pd.api.types.is_bool_dtype(col.dtype):
+            df.isetitem(i, pd.to_numeric(col, downcast="integer"))
+        elif (len(col) >= COMPACT_MIN_ROWS and (col.dtype == object or isinstance(col.dtype, pd.StringDtype))
+              and col.iloc[:COMPACT_MIN_ROWS].nunique() <= COMPACT_MIN_ROWS * COMPACT_CATEGORY_RATIO
+              and pd.api.types.infer_dtype(col, skipna=True) == "string"):
+            codes, uniques = pd.factorize(col.to_numpy(dtype=object))
+            if len(uniques) <= len(col) * COMPACT_CATEGORY_RATIO:
+                df.isetitem(i, pd.Series(pd.Categorical.from_codes(codes, categories=uniques), index=df.index))
+    return df.copy()
+
+
+def strip_columns(df):
+    """清理列名首尾空格（非字符串列名原样保留）"""
+    df.columns = [c.strip() if isinstance(c, str) else c for c in df.columns]
+    return df
+
+
+def read_columns(xls, sheet_name, header_row, columns):
+    """只解析工作表中指定的列
+
+    先读取表头行定位各列的位置，再按位置投影读取，避免物化整张宽表。
+    返回按 columns 顺序排列的 DataFrame；缺少列时返回 (None, 缺失列列表)。
+    """
+    header = [c.strip() if isinstance(c, str) else c
+              for c in xls.parse(sheet_name, header=header_row, nrows=0).columns]
+    missing = [c for c in columns if c not in header]
+    if missing:
+        return None, missing
+
+    positions = sorted({header.index(c) for c in columns})
+    df = strip_columns(xls.parse(sheet_name, header=header_row, usecols=positions))
+    return df[list(columns)], []
+
+
+# ---------------------- 合并前预检 ----------------------
+PREFLIGHT_SAMPLE_ROWS = 5  # 表头之后额外读取的样本行数
+PREFLIGHT_SCAN_ROWS = 20  # 列名不在表头行时，在前若干行中查找以提示正确的行号
+
+
+def sample_sheet_rows(file_path, max_rows):
+    """以只读流式方式读取每个工作表的前 max_rows 行，读到即停止，不解析整张表
+
+    返回 {工作表名: [行值元组, ...]}。
+    """
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        return read_sheet_rows(wb, max_rows)
+    finally:
+        wb.close()
+
+
+def read_sheet_rows(wb, max_rows):
+    """从已打开的只读工作簿中读取每个工作表的前 max_rows 行，返回 {工作表名: [行值元组, ...]}"""
+    return {ws.title: list(ws.iter_rows(min_row=1, max_row=max_rows, values_only=True)) for ws in wb.worksheets}
+
+
+def header_names(row):
+    """表头行的单元格值（字符串去除首尾空格，与 strip_columns 一致）"""
+    return [c.strip() if isinstance(c, str) else c for c in row]
+
+
+def check_sheet_header(rows, header_row, columns):
+    """检查样本行中的表头行是否包含所需列，返回问题描述（无问题时为 None）"""
+    if not any(v is not None for row in rows for v in row):
+        return None  # 空工作表：合并时跳过
+    if len(rows) <= header_row or not any(v is not None for v in rows[header_row]):
+        return f"第 {header_row + 1} 行为空，请检查列名行号"
+
+    header = header_names(rows[header_row])
+    missing = [c for c in columns if c not in header]
+    if not missing:
+        return None
+
+    problem = f"第 {header_row + 1} 行缺少列 {describe_columns(missing)}"
+    for idx, row in enumerate(rows):
+        names = set(header_names(row))
+        if idx != header_row and all(c in names for c in columns):
+            problem += f"（所需列名位于第 {idx + 1} 行）"
+            break
+    return problem
+
+
+def preflight_check(options, target_files=None):
+    """合并前预检：只读取两侧所有工作表的表头附近几行，一次性找出全部列名与行号问题
+
+    target_files 默认为 options.target_file（批量合并时传入全部目标文件）。返回问题描述列表。
+    """
+    problems = []
+    checks = [(f, options.target_header_row, [*options.target_keys, *options.target_cols], "目标文件")
+              for f in (target_files or [options.target_file])]
+    checks += [(f, options.source_header_row, [*options.source_keys, *options.source_cols], "数据文件")
+               for f in options.source_files]
+
+    for file_path, header_row, columns, role in checks:
+        name = os.path.basename(file_path)
+        max_rows = max(header_row + 1 + PREFLIGHT_SAMPLE_ROWS, PREFLIGHT_SCAN_ROWS)
+        try:
+            sheets = sample_sheet_rows(file_path, max_rows)
+        except Exception as e:
+            problems.append(f"{role} {name} 无法读取：{e}")
+            continue
+        for sheet_name, rows in sheets.items():
+            problem = check_sheet_header(rows, header_row, columns)
+            if problem:
+                problems.append(f"{role} {name} 的工作表 {sheet_name}：{problem}")
+    return problems
+
+
+# ---------------------- 列名行号识别 ----------------------
+HEADER_CACHE_NAME = "header_template"
+
+
+def header_text(row):
+    """表头行中非空单元格的文本，用于核对同模板文件"""
+    return tuple(str(c) for c in header_names(row) if c is not None)
+
+
+def detect_header_row(file_path, columns, scan_rows=PREFLIGHT_SCAN_ROWS, use_cache=True):
+    """在每个工作表的前 scan_rows 行中查找包含全部所需列名的行，返回 (行索引, 是否来自缓存)
+
+    行索引从0开始；多数工作表在同一行找到列名时取该行，未找到时返回 (None, False)。
+    识别结果按模板缓存：键为工作表名（只读打开即可得到，无需读取单元格）与所需列名，
+    缓存行号及各工作表在该行的表头文本。同模板的文件只读到该行核对表头，不一致时才重新扫描。
+    """
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        cache = DiskCache(HEADER_CACHE_NAME, max_bytes=4 * 1024 * 1024) if use_cache else None
+        key = make_key(tuple(wb.sheetnames), tuple(columns)) if cache is not None else None
+        cached = cache.get(key) if cache is not None else None
+        if cached is not None:
+            cached_row, cached_headers = cached
+            sheets = read_sheet_rows(wb, cached_row + 1)
+            if all(len(sheets[name]) > cached_row and header_text(sheets[name][cached_row]) == text
+                   for name, text in cached_headers.items()):
+                return cached_row, True
+
+        sheets = read_sheet_rows(wb, scan_rows)
+    finally:
+        wb.close()
+
+    filled = {name: rows for name, rows in sheets.items() if any(v is not None for row in rows for v in row)}
+    if not filled:
+        return None, False
+
+    votes = [sum(1 for rows in filled.values()
+                 if len(rows) > idx and all(c in header_names(rows[idx]) for c in columns))
+             for idx in range(scan_rows)]
+    best = max(range(scan_rows), key=lambda idx: (votes[idx], -idx))
+    if not votes[best]:
+        return None, False
+
+    if cache is not None:
+        headers = {name: header_text(rows[best]) for name, rows in filled.items() if len(rows) > best}
+        cache.put(key, (best, headers))
+    return best, False
+
+
+SOURCE_CACHE_NAME = "merge_source"
+
+
+def source_cache_key(options, source_file):
+    """数据文件缓存键：文件路径、大小、修改时间、表头行、读取的列与读取方式"""
+    return make_key(file_signature(source_file), options.source_header_row,
+                    tuple(options.source_keys), tuple(options.source_cols), options.source_mode,
+                    options.compact_dtypes)
+
+
+# 数据文件读取方式：方式名 -> 显示名称
+SOURCE_MODES = {
+    "memory": "常规读取",
+    "stream": "流式读取（省内存）",
+    "spill": "流式读取 + 磁盘索引（超大文件）",
+}
+STREAM_CHUNK_ROWS = 50000  # 流式读取时每批转换的行数
+
+
+def iter_source_chunks(options, source_file, is_cancelled=None, chunk_rows=STREAM_CHUNK_ROWS):
+    """以只读行迭代器逐行读取数据文件，只保留 [匹配列..., 来源列...]，按批产出 (工作表名, DataFrame)
+
+    不构建整张表，内存占用只与每批行数有关；整张为空的工作表跳过，全部所需列为空的行丢弃。
+    缺少列时抛出 MergeError，is_cancelled() 返回真时抛出 MergeCancelled。
+    """
+    columns = list(dict.fromkeys([*options.source_keys, *options.source_cols]))
+    wb = openpyxl.load_workbook(source_file, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            rows = ws.iter_rows(min_row=options.source_header_row + 1, values_only=True)
+            header = header_names(next(rows, ()))
+            if not any(c is not None for c in header):
+                if ws.max_row and ws.max_row > options.source_header_row + 1:
+                    raise MergeError(f"错误：数据文件 {os.path.basename(source_file)} 的工作表 {ws.title} "
+                                     f"第 {options.source_header_row + 1} 行为空，请检查列名行号")
+                continue
+            missing = [c for c in columns if c not in header]
+            if missing:
+                raise MergeError(f"错误：数据文件 {os.path.basename(source_file)} 的工作表 {ws.title} "
+                                 f"缺少列 {describe_columns(missing)}")
+
+            positions = [header.index(c) for c in columns]
+            buffer = []
+            for row in rows:
+                picked = tuple(row[p] if p < len(row) else None for p in positions)
+                if any(v is not None for v in picked):
+                    buffer.append(picked)
+                if len(buffer) >= chunk_rows:
+                    if is_cancelled and is_cancelled():
+                        raise MergeCancelled()
+                    yield ws.title, pd.DataFrame(buffer, columns=columns).infer_objects()
+                    buffer = []
+            yield ws.title, pd.DataFrame(buffer, columns=columns).infer_objects()
+    finally:
+        wb.close()
+
+
+def stream_source_frame(options, source_file, is_cancelled=None):
+    """流式读取一个数据文件的 [匹配列..., 来源列...]，返回 (DataFrame, 工作表数量)"""
+    columns = list(dict.fromkeys([*options.source_keys, *options.source_cols]))
+    frames, sheets = [], set()
+    for sheet_name, chunk in iter_source_chunks(options, source_file, is_cancelled):
+        sheets.add(sheet_name)
+        frames.append(chunk)
+    source_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+    return source_df, len(sheets)
+
+
+def read_source_frame(options, source_file, is_cancelled=None):
+    """读取一个数据文件所有工作表的 [匹配列..., 来源列...]，返回 (DataFrame, 工作表数量)"""
+    if options.source_mode == "stream":
+        source_df, sheets = stream_source_frame(options, source_file, is_cancelled)
+    else:
+        source_df, sheets = parse_source_frame(options, source_file, is_cancelled)
+    return (compact_frame(source_df) if options.compact_dtypes else source_df), sheets
+
+
+def parse_source_frame(options, source_file, is_cancelled=None):
+    """用 pandas 解析一个数据文件所有工作表的 [匹配列..., 来源列...]，返回 (DataFrame, 读取的工作表数量)"""
+    columns = list(dict.fromkeys([*options.source_keys, *options.source_cols]))
+    frames = []
+    with pd.ExcelFile(source_file) as xls:
+        for sheet_name in xls.sheet_names:
+            if is_cancelled and is_cancelled():
+                raise MergeCancelled()
+            df, missing = read_columns(xls, sheet_name, options.source_header_row, columns)
+            if missing:
+                # 与 iter_source_chunks 一致：表头行没有任何内容时，空工作表跳过，表头行下方有数据则提示行号错误
+                head = xls.parse(sheet_name, header=None, nrows=options.source_header_row + 2)
+                header_cells = head.iloc[options.source_header_row] if len(head) > options.source_header_row else ()
+                if not any(pd.notna(v) for v in header_cells):
+                    if len(head) > options.source_header_row + 1:
+                        raise MergeError(f"错误：数据文件 {os.path.basename(source_file)} 的工作表 {sheet_name} "
+                                         f"第 {options.source_header_row + 1} 行为空，请检查列名行号")
+                    continue
+                raise MergeError(f"错误：数据文件 {os.path.basename(source_file)} 的工作表 {sheet_name} "
+                                 f"缺少列 {describe_columns(missing)}")
+            frames.append(df)
+
+    source_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+    return source_df, len(frames)
+
+
+def read_source_frames(options, source_files, is_cancelled=None):
+    """读取多个数据文件，多于一个文件且有多个CPU时在进程池中并行解析
+
+    返回与 source_files 顺序一致的 [(DataFrame, 工作表数量)]。
+    """
+    workers = min(len(source_files), os.cpu_count() or 1)
+    if workers <= 1:
+        return [read_source_frame(options, f, is_cancelled) for f in source_files]
+
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(read_source_frame, options, f) for f in source_files]
+        pending = set(futures)
+        while pending:
+            if is_cancelled and is_cancelled():
+                raise MergeCancelled()
+            _, pending = wait(pending, timeout=0.2)
+        results = [future.result() for future in futures]
+    except BaseException:
+        # 出错或取消时丢弃尚未开始的文件，不等待正在解析的文件
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
+    return results
+
+
+def load_source_lookup(options, is_cancelled=None):
+    """读取全部数据文件并构建一个查找表（后面的文件优先）
+
+    options.use_cache 为真时逐个文件优先使用磁盘缓存中已解析的列，未变化的文件跳过 Excel 解析，
+    其余文件并行解析。返回 (查找表, SourceInfo)。
+    缺少列时抛出 MergeError，is_cancelled() 返回真时抛出 MergeCancelled。
+    """
+    if options.source_mode == "spill":
+        return SpilledSourceLookup.build(options, is_cancelled)
+
+    source_files = list(options.source_files)
+    cache = DiskCache(SOURCE_CACHE_NAME) if options.use_cache else None
+    results = [None] * len(source_files)
+    cache_keys = [None] * len(source_files)
+    if cache:
+        for i, source_file in enumerate(source_files):
+            cache_keys[i] = source_cache_key(options, source_file)
+            cached = cache.get(cache_keys[i])
+            if cached is not None:
+                results[i] = (cached["frame"], cached["sheets"])
+
+    to_parse = [i for i, result in enumerate(results) if result is None]
+    parsed = read_source_frames(options, [source_files[i] for i in to_parse], is_cancelled)
+    for i, result in zip(to_parse, parsed):
+        results[i] = result
+        if cache:
+            cache.put(cache_keys[i], {"frame": result[0], "sheets": result[1]})
+
+    frames = [source_df for source_df, _ in results]
+    labels = [os.path.basename(f) for f in source_files]
+    lookup = SourceLookup.from_frames(frames, labels, options.source_keys, options.source_cols,
+                                      options.normalize_keys, options.duplicate_policy)
+    info = SourceInfo(files=len(source_files), sheets=sum(sheets for _, sheets in results),
+                      rows=sum(len(df) for df in frames), cached_files=len(source_files) - len(to_parse))
+    return lookup, info
+
+
+# ---------------------- 磁盘索引查找表 ----------------------
+SPILL_DIR_NAME = "merge_spill"
+SPILL_STALE_SECONDS = 3600  # 超过此时间未修改、且不属于本进程查找表的索引文件视为异常退出后的残留
+_live_spill_paths = set()  # 本进程中仍在使用的索引文件
+
+
+def sql_value(value):
+    """转换为 SQLite 可存储的值：空值为 NULL，numpy 标量转 Python 标量，日期时间转 ISO 文本"""
+    if value is None or (isinstance(value, float) and np.isnan(value)) or value is pd.NaT:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat(sep=" ") if isinstance(value, datetime.datetime) else value.isoformat()
+    return value
+
+
+def discard_spill(state):
+    """关闭连接并删除磁盘索引文件（由 weakref.finalize 在查找表释放时调用）"""
+    if state.get("conn") is not None:
+        state["conn"].close()
+        state["conn"] = None
+    _live_spill_paths.discard(state["path"])
+    try:
+        os.remove(state["path"])
+    except OSError:
+        pass
+
+
+def clean_stale_spills():
+    """删除程序崩溃或被结束时留下的磁盘索引文件，返回删除的文件数
+
+    正常情况下索引文件在查找表释放时删除；本进程仍在使用的文件与最近修改的文件
+    （可能属于另一个正在运行的窗口）保留，其余一律删除（Windows 下被占用的文件删除失败时跳过）。
+    """
+    directory = cache_dir(SPILL_DIR_NAME)
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.endswith(".sqlite") or path in _live_spill_paths:
+            continue
+        try:
+            if time.time() - os.path.getmtime(path) < SPILL_STALE_SECONDS:
+                continue
+            os.remove(path)
+            removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+class SpilledSourceLookup(SourceLookup):
+    """存放在磁盘 SQLite 表中的查找表，接口与 SourceLookup 相同，内存占用不随数据文件大小增长
+
+    构建时逐批写入原始键值，再用 SQL 分组完成重复键处理与多文件覆盖；查找时把目标键写入临时表后连接查询。
+    可被 pickle 传入子进程（只传文件路径，子进程中重新打开连接），文件在主进程中的对象释放时删除。
+    """
+
+    def __init__(self, path, key_count, value_cols, normalize=False, labels=None, duplicates=None):
+        self.path = path
+        self.key_cols = [f"k{i}" for i in range(key_count)]
+        self.value_cols = list(value_cols)
+        self.normalize = normalize
+        self.sources = labels  # 多个数据文件时为各文件显示名列表，单个数据文件时为 None
+        self.duplicates = duplicates or DuplicateReport()
+        self._state = {"path": path, "conn": None}
+        self._finalizer = weakref.finalize(self, discard_spill, self._state)
+        _live_spill_paths.add(path)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_state"] = {"path": self.path, "conn": None}
+        state["_finalizer"] = None  # 子进程中的副本不删除文件
+        return state
+
+    def detach_inherited(self):
+        """在子进程中调用：fork 启动时对象直接继承自父进程而非经过 pickle，
+        需放弃父进程的 SQLite 连接（连接不能跨 fork 使用）与删除文件的责任，之后按路径重新打开"""
+        if self._finalizer is not None:
+            self._finalizer.detach()
+            self._finalizer = None
+        self._state = {"path": self.path, "conn": None}
+
+    @property
+    def conn(self):
+        if self._state["conn"] is None:
+            self._state["conn"] = sqlite3.connect(self.path, check_same_thread=False)
+        return self._state["conn"]
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM lookup").fetchone()[0]
+
+    @classmethod
+    def build(cls, options, is_cancelled=None):
+        """流式读取全部数据文件写入磁盘索引，返回 (查找表, SourceInfo)"""
+        clean_stale_spills()
+        fd, path = tempfile.mkstemp(suffix=".sqlite", dir=cache_dir(SPILL_DIR_NAME))
+        os.close(fd)
+        source_files = list(options.source_files)
+        labels = [os.path.basename(f) for f in source_files]
+        if len(set(labels)) != len(labels):
+            labels = [f"{i + 1}:{label}" for i, label in enumerate(labels)]
+        lookup = cls(path, len(options.source_keys), options.source_cols, options.normalize_keys,
+                     labels if len(source_files) > 1 else None)
+
+        conn = lookup.conn
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        k_cols, v_cols = lookup.key_cols, [f"v{i}" for i in range(len(lookup.value_cols))]
+        conn.execute(f"CREATE TABLE raw (seq INTEGER PRIMARY KEY, src INTEGER, {', '.join(k_cols + v_cols)})")
+        insert = (f"INSERT INTO raw (src, {', '.join(k_cols + v_cols)}) "
+                  f"VALUES ({', '.join('?' * (1 + len(k_cols) + len(v_cols)))})")
+
+        info = SourceInfo(files=len(source_files))
+        for src, source_file in enumerate(source_files):
+            sheets = set()
+            for sheet_name, chunk in iter_source_chunks(options, source_file, is_cancelled):
+                sheets.add(sheet_name)
+                index, valid = build_key_index([chunk[c] for c in options.source_keys], options.normalize_keys)
+                keys = index[valid].tolist()
+                values = chunk.loc[valid, lookup.value_cols].to_numpy(dtype=object).tolist()
+                conn.executemany(insert, ((src, *map(sql_value, key if isinstance(key, tuple) else (key,)),
+                                           *map(sql_value, row)) for key, row in zip(keys, values)))
+                info.rows += len(chunk)
+            info.sheets += len(sheets)
+
+        lookup.resolve(options.duplicate_policy)
+        return lookup, info
+
+    def resolve(self, policy):
+        """按重复键策略与文件优先级把原始表归并为唯一键的 lookup 表"""
+        conn = self.conn
+        keys = ", ".join(self.key_cols)
+        join_on = " AND ".join(f"r.{k} = p.{k}" for k in self.key_cols)
+        v_cols = [f"v{i}" for i in range(len(self.value_cols))]
+        conn.execute(f"CREATE INDEX raw_key ON raw ({keys}, src)")
+
+        # 重复键扫描：同一文件内出现多次的键，任一来源列取值不同即为冲突
+        distinct = [f"COUNT(DISTINCT COALESCE(CAST({v} AS TEXT), 'nan'))" for v in v_cols]
+        distinct_expr = distinct[0] if len(distinct) == 1 else f"MAX({', '.join(distinct)})"
+        report = DuplicateReport()
+        conflicts = []
+        for row in conn.execute(f"SELECT src, {keys}, COUNT(*), {distinct_expr} FROM raw "
+                                f"GROUP BY src, {keys} HAVING COUNT(*) > 1"):
+            src, key, count, n_distinct = row[0], row[1:-2], row[-2], row[-1]
+            report.duplicate_keys += 1
+            report.duplicate_rows += count
+            if n_distinct > 1:
+                report.conflict_keys += 1
+                if len(conflicts) < MAX_DUPLICATE_EXAMPLES:
+                    conflicts.append((src, key))
+        for src, key in conflicts:
+            rows = conn.execute(f"SELECT {', '.join(v_cols)} FROM raw WHERE src = ? AND "
+                                + " AND ".join(f"{k} = ?" for k in self.key_cols) + " ORDER BY seq",
+                                (src, *key)).fetchall()
+            shown = [r[0] if len(r) == 1 else r for r in rows]
+            label = self.sources[src] if self.sources else ""
+            report.examples.append((label, format_key(key if len(key) > 1 else key[0]), shown))
+        self.duplicates = report
+        if policy == "error" and report.conflict_keys:
+            raise MergeError("错误：数据文件中存在取值不一致的重复键\n" + "\n".join(report.describe(policy)))
+
+        # 每个键取优先级最高（排在最后）的文件，再在该文件内按策略取值
+        # SQLite 中与 MIN()/MAX() 同查的普通列取自该最小/最大行
+        picked = [f"r.{v}" for v in v_cols]
+        if policy == "mean":
+            for i, v in enumerate(v_cols):
+                numeric = conn.execute(f"SELECT COUNT({v}) = SUM(typeof({v}) IN ('integer', 'real')) "
+                                       f"FROM raw").fetchone()[0]
+                if numeric:  # 只对纯数值列取平均，其余保留第一个
+                    picked[i] = f"AVG(r.{v})"
+        seq = "MAX(r.seq)" if policy == "last" else "MIN(r.seq)"
+        conn.execute(f"CREATE TABLE pick AS SELECT {keys}, MAX(src) AS src FROM raw GROUP BY {keys}")
+        conn.execute(f"CREATE TABLE lookup (pos INTEGER PRIMARY KEY, {keys}, {', '.join(v_cols)}, src INTEGER)")
+        conn.execute(f"INSERT INTO lookup ({keys}, {', '.join(v_cols)}, src) "
+                     f"SELECT {keys}, {', '.join(v_cols)}, src FROM "
+                     f"(SELECT {', '.join(f'r.{k} AS {k}' for k in self.key_cols)}, {seq} AS seq, "
+                     f"{', '.join(f'{p} AS {v}' for p, v in zip(picked, v_cols))}, r.src AS src "
+                     f"FROM raw r JOIN pick p ON {join_on} AND r.src = p.src "
+                     f"GROUP BY {', '.join(f'r.{k}' for k in self.key_cols)}) ORDER BY seq")
+        conn.execute(f"CREATE UNIQUE INDEX lookup_key ON lookup ({keys})")
+        conn.execute("DROP TABLE raw")
+        conn.execute("DROP TABLE pick")
+        conn.commit()
+
+    def index_positions(self, index, valid):
+        """把目标键写入临时表与 lookup 表连接，返回每行键的位置（无效键与未匹配为 -1）"""
+        positions = np.full(len(index), -1, dtype=np.int64)
+        keys = self.key_cols
+        conn = self.conn
+        conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS probe (i INTEGER PRIMARY KEY, {', '.join(keys)})")
+        conn.execute("DELETE FROM probe")
+        rows = np.flatnonzero(valid)
+        conn.executemany(f"INSERT INTO probe VALUES ({', '.join('?' * (1 + len(keys)))})",
+                         ((int(i), *map(sql_value, key if isinstance(key, tuple) else (key,)))
+                          for i, key in zip(rows, index[valid])))
+        found = conn.execute(f"SELECT probe.i, lookup.pos - 1 FROM probe JOIN lookup ON "
+                             + " AND ".join(f"probe.{k} = lookup.{k}" for k in keys)).fetchall()
+        conn.execute("DELETE FROM probe")
+        if found:
+            found = np.asarray(found, dtype=np.int64)
+            positions[found[:, 0]] = found[:, 1]
+        return positions
+
+    def fetch(self, column, positions):
+        """按位置从 lookup 表取一列，未匹配的位置为 NaN"""
+        wanted = np.unique(positions[positions >= 0])
+        conn = self.conn
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS wanted (pos INTEGER PRIMARY KEY)")
+        conn.execute("DELETE FROM wanted")
+        conn.executemany("INSERT INTO wanted VALUES (?)", ((int(p) + 1,) for p in wanted))
+        rows = conn.execute(f"SELECT lookup.pos - 1, {column} FROM lookup JOIN wanted USING (pos)").fetchall()
+        conn.execute("DELETE FROM wanted")
+        fetched = pd.Series([v for _, v in rows], index=[p for p, _ in rows], dtype=None if rows else object)
+        return fetched.reindex(positions).to_numpy()
+
+    def take(self, value_col, positions):
+        return self.fetch(f"v{self.value_cols.index(value_col)}", positions)
+
+    def take_sources(self, positions):
+        codes = self.fetch("src", positions)
+        labels = np.asarray(self.sources, dtype=object)
+        result = np.full(len(positions), np.nan, dtype=object)
+        matched = ~pd.isna(codes)
+        result[matched] = labels[codes[matched].astype(np.int64)]
+        return result
+
+    def source_counts(self, positions):
+        if self.sources is None:
+            return {}
+        counts = pd.Series(self.take_sources(positions)).value_counts()
+        return {label: int(counts[label]) for label in self.sources if label in counts.index}
+
+
+def fill_target_sheet(xls, sheet_name, options, lookup):
+    """读取一个目标工作表并用查找表填充待填列
+
+    返回 (DataFrame, MatchStats)；工作表为空时返回 (None, None)，缺少列时抛出 MergeError。
+    """
+    df = xls.parse(sheet_name, header=options.target_header_row)
+    if df.empty:
+        return None, None
+
+    strip_columns(df)
+    missing = [c for c in (*options.target_keys, *options.target_cols) if c not in df.columns]
+    if missing:
+        raise MergeError(f"错误：目标工作表 {sheet_name} 缺少列 {describe_columns(missing)}")
+
+    stats = lookup.fill(df, options.target_keys, options.column_pairs)
+    # 结果会在界面中保留到下次合并；复制（或压缩后复制）一次，释放解析时的中间缓冲
+    return (compact_frame(df) if options.compact_dtypes else df.copy()), stats
+
+
+def iter_sheet_rows(df, chunk_size=5000):
+    """逐行产出可写入 openpyxl 的值列表（缺失值转为 None），按块转换以限制内存"""
+    for start in range(0, len(df), chunk_size):
+        chunk = df.iloc[start:start + chunk_size].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        for row in chunk.itertuples(index=False, name=None):
+            yield list(row)
+
+
+def write_sheets(file_path, sheets):
+    """以流式（write_only）模式将多个工作表写入同一个 xlsx 文件，保留原工作表名
+
+    sheets 为 {工作表名: DataFrame}；write_only 模式逐行写出，内存占用不随行数增长。
+    """
+    wb = openpyxl.Workbook(write_only=True)
+    for sheet_name, df in sheets.items():
+        ws = wb.create_sheet(title=sheet_name)
+        ws.append(list(df.columns))
+        for row in iter_sheet_rows(df):
+            ws.append(row)
+    wb.save(file_path)
+
+
+def patch_workbook(options, lookup, output_file):
+    """在目标工作簿原文件上只改写待填列的单元格并另存，保留格式、公式与合并单元格
+
+    逐个工作表读取表头行定位匹配列与各待填列，匹配值通过查找表一次性查出后写回；
+    只改写匹配成功的行：未匹配的行（小计、空行等）与公式单元格保持原样。
+    返回 {工作表名: MatchStats}；空工作表跳过，缺少列时抛出 MergeError。
+    """
+    header_row = options.target_header_row + 1  # openpyxl 行号从1开始
+    wb = openpyxl.load_workbook(options.target_file, keep_vba=options.target_file.lower().endswith('.xlsm'))
+    results = {}
+    try:
+        for ws in wb.worksheets:
+            if ws.max_row <= header_row:
+                continue
+
+            header = [c.strip() if isinstance(c, str) else c
+                      for c in next(ws.iter_rows(min_row=header_row, max_row=header_row, values_only=True))]
+            missing = [c for c in (*options.target_keys, *options.target_cols) if c not in header]
+            if missing:
+                raise MergeError(f"错误：目标工作表 {ws.title} 缺少列 {describe_columns(missing)}")
+            key_positions = [header.index(c) for c in options.target_keys]
+
+            rows = list(ws.iter_rows(min_row=header_row + 1, values_only=True))
+            key_columns = [[row[i] for row in rows] for i in key_positions]
+            positions = lookup.lookup_positions(key_columns)
+            matched_offsets = np.flatnonzero(positions >= 0)
+            for value_col, target_name in options.column_pairs:
+                target_col = header.index(target_name) + 1
+                values = lookup.take(value_col, positions)
+                for offset in matched_offsets:
+                    cell = ws.cell(row=header_row + 1 + int(offset), column=target_col)
+                    if cell.data_type == "f":
+                        continue  # 公式单元格保持原样
+                    value = values[offset]
+                    # 直接赋值 .value：来源值为空时需要清空原有内容，ws.cell(value=None) 不会清空
+                    cell.value = None if pd.isna(value) else value
+
+            matched = int((positions >= 0).sum())
+            results[ws.title] = MatchStats(matched=matched, unmatched=len(positions) - matched)
+        wb.save(output_file)
+    finally:
+        wb.close()
+    return results
+
+
+# ---------------------- 进程池任务 ----------------------
+_worker_lookup = None  # 子进程内共享的查找表，由进程池初始化函数载入
+
+
+def init_lookup_worker(lookup):
+    """进程池初始化：每个子进程只接收一次查找表"""
+    global _worker_lookup
+    if isinstance(lookup, SpilledSourceLookup):
+        lookup.detach_inherited()
+    _worker_lookup = lookup
+
+
+def run_sheet_task(options, sheet_name):
+    """进程池任务：读取并填充目标文件中的一个工作表
+
+    返回 (工作表名, DataFrame, MatchStats, 耗时秒数)，空工作表的 DataFrame 为 None。
+    """
+    start = time.perf_counter()
+    with pd.ExcelFile(options.target_file) as xls:
+        df, stats = fill_target_sheet(xls, sheet_name, options, _worker_lookup)
+    return sheet_name, df, stats, time.perf_counter() - start
+
+
+def fill_workbook(options, lookup, output_file, in_place=False):
+    """填充一个目标工作簿的所有工作表并写出到 output_file
+
+    in_place 为真时在原文件格式上写回（见 patch_workbook），否则导出合并结果。
+    返回 {工作表名: MatchStats}。
+    """
+    if in_place:
+        return patch_workbook(options, lookup, output_file)
+
+    sheets, results = {}, {}
+    with pd.ExcelFile(options.target_file) as xls:
+        for sheet_name in xls.sheet_names:
+            df, stats = fill_target_sheet(xls, sheet_name, options, lookup)
+            if df is not None:
+                sheets[sheet_name] = df
+                results[sheet_name] = stats
+    if sheets:
+        write_sheets(output_file, sheets)
+    return results
+
+
+# ---------------------- 批量合并 ----------------------
+BATCH_OUTPUT_SUFFIX = "_已填充"
+
+
+@dataclass
+class BatchFileResult:
+    """批量合并中单个目标文件的处理结果"""
+    target_file: str
+    output_file: str = ""
+    sheets: int = 0
+    matched: int = 0
+    unmatched: int = 0
+    seconds: float = 0.0
+    error: str = ""
+
+
+def output_extension(target_file, in_place=False):
+    """输出文件扩展名：按原格式写回时沿用目标文件的扩展名（.xlsm 保留宏，改成 .xlsx 后 Excel 无法打开），否则为 .xlsx"""
+    ext = os.path.splitext(target_file)[1]
+    return ext if in_place and ext else ".xlsx"
+
+
+def batch_output_path(target_file, in_place=False):
+    """批量输出文件路径：与输入文件同目录，文件名追加后缀"""
+    base = os.path.splitext(target_file)[0]
+    return f"{base}{BATCH_OUTPUT_SUFFIX}{output_extension(target_file, in_place)}"
+
+
+def collect_target_files(folder):
+    """列出文件夹中的 Excel 目标文件（跳过临时文件与本工具生成的输出文件）"""
+    files = []
+    for name in sorted(os.listdir(folder)):
+        base, ext = os.path.splitext(name)
+        if ext.lower() not in (".xlsx", ".xlsm") or name.startswith("~$") or base.endswith(BATCH_OUTPUT_SUFFIX):
+            continue
+        files.append(os.path.join(folder, name))
+    return files
+
+
+def run_batch_file(options, target_file, in_place=False):
+    """进程池任务：用子进程中的查找表填充一个目标文件，返回 BatchFileResult"""
+    start = time.perf_counter()
+    output_file = batch_output_path(target_file, in_place)
+    results = fill_workbook(replace(options, target_file=target_file), _worker_lookup, output_file, in_place)
+    return BatchFileResult(
+        target_file=target_file,
+        output_file=output_file,
+        sheets=len(results),
+        matched=sum(s.matched for s in results.values()),
+        unmatched=sum(s.unmatched for s in results.values()),
+        seconds=time.perf_counter() - start,
+    )
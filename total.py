@@ -1,12 +1,18 @@
 import sys
-from PySide6.QtWidgets import QApplication, QMainWindow, QPushButton, QFileDialog, QVBoxLayout, QWidget, QLabel, QListWidget, QHBoxLayout, QMessageBox, QTableWidget, QTableWidgetItem, QDialog, QTextEdit
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from PySide6.QtWidgets import QApplication, QMainWindow, QPushButton, QFileDialog, QVBoxLayout, QWidget, QLabel, QListWidget, QHBoxLayout, QMessageBox, QTableWidget, QTableWidgetItem, QDialog, QTextEdit, QCheckBox, QLineEdit
 from PySide6.QtGui import QKeySequence, QShortcut
+from PySide6 import QtCore
 from PySide6.QtCore import Qt, Signal, QDateTime
 import pandas as pd
 import os
 import calendar
 from datetime import datetime
 
+from app_cache import DiskCache
+from total_engine import RESULT_CACHE_NAME, TOTAL_LABELS, extract_total, result_cache_key, split_labels
+
 class LogDialog(QDialog):
     def __init__(self, parent=None, log_text=""):
         super().__init__(parent)
@@ -39,6 +45,108 @@ class LogDialog(QDialog):
                 self.parent().status_bar.showMessage("日志已复制到剪贴板", 3000)
 
 
+class ExtractWorker(QtCore.QObject):
+    """后台提取任务：未修改的文件直接使用磁盘缓存的结果，其余文件分发到进程池并行提取，按完成顺序收集结果"""
+    log_signal = Signal(str)
+    finished_signal = Signal(object)  # {日期: (文件名, 合计数据)}
+
+    def __init__(self, tasks, labels=TOTAL_LABELS, use_cache=True):
+        super().__init__()
+        self.tasks = tasks  # [(日期, 文件路径)]，按文件列表顺序
+        self.labels = tuple(labels)  # 查找的标签组，如 ("合计", "总计", "小计")
+        self.use_cache = use_cache  # 复用提取结果缓存与合计位置缓存
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def run(self):
+        # 同一日期有多个文件时保留列表中靠前的文件：{日期: (列表序号, 文件名, 合计数据)}
+        day_entries = {}
+        try:
+            cache = DiskCache(RESULT_CACHE_NAME, max_bytes=16 * 1024 * 1024) if self.use_cache else None
+            pending, done = self.collect_cached(cache, day_entries)
+            workers = min(len(pending), os.cpu_count() or 1)
+            if workers > 1:
+                self.log_signal.emit(f"使用 {workers} 个进程并行提取 {len(pending)} 个文件")
+                executor = ProcessPoolExecutor(max_workers=workers)
+                try:
+                    futures = {executor.submit(extract_total, task[2], self.use_cache, self.labels): task
+                               for task in pending}
+                    not_done = set(futures)
+                    while not_done and not self.is_cancelled():
+                        finished, not_done = wait(not_done, timeout=0.2, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            done += 1
+                            order, day, file_path, key = futures[future]
+                            try:
+                                result = future.result()
+                            except Exception as e:
+                                self.log_signal.emit(f"读取文件 {os.path.basename(file_path)} 失败：{e}")
+                                continue
+                            self.store(cache, key, day, result)
+                            self.collect(day_entries, order, day, file_path, result, done)
+                    if self.is_cancelled():
+                        self.log_signal.emit("⚠️ 提取已取消")
+                finally:
+                    # 取消时丢弃尚未开始的文件，不等待正在读取的文件
+                    executor.shutdown(wait=not self.is_cancelled(), cancel_futures=True)
+            else:
+                for done, (order, day, file_path, key) in enumerate(pending, done + 1):
+                    if self.is_cancelled():
+                        break
+                    try:
+                        result = extract_total(file_path, self.use_cache, self.labels)
+                    except Exception as e:
+                        self.log_signal.emit(f"读取文件 {os.path.basename(file_path)} 失败：{e}")
+                        continue
+                    self.store(cache, key, day, result)
+                    self.collect(day_entries, order, day, file_path, result, done)
+        finally:
+            self.finished_signal.emit({day: entry[1:] for day, entry in day_entries.items()})
+
+    def collect_cached(self, cache, day_entries):
+        """先收集缓存中未修改文件的结果，返回 (需要解析的 [(列表序号, 日期, 文件路径, 缓存键)], 已完成数)"""
+        pending = []
+        done = 0
+        for order, (day, file_path) in enumerate(self.tasks):
+            key = cached = None
+            if cache is not None:
+                try:
+                    key = result_cache_key(file_path, self.labels)
+                except OSError:
+                    key = None  # 文件不可访问，交给解析时报错
+                cached = cache.get(key) if key else None
+            if cached is not None and cached["day"] == day:
+                done += 1
+                self.collect(day_entries, order, day, file_path, cached["result"], done, from_cache=True)
+            else:
+                pending.append((order, day, file_path, key))
+        if done:
+            self.log_signal.emit(f"{done} 个文件未修改，使用上次的提取结果；需要解析 {len(pending)} 个文件")
+        return pending, done
+
+    @staticmethod
+    def store(cache, key, day, result):
+        """保存单个文件的提取结果（未找到合计也缓存，下次同样跳过）"""
+        if cache is not None and key:
+            cache.put(key, {"day": day, "result": result})
+
+    def collect(self, day_entries, order, day, file_path, result, done, from_cache=False):
+        """把一个文件的提取结果按日期放入 day_entries 并回报进度"""
+        progress = f"[{done}/{len(self.tasks)}]"
+        source = "（缓存）" if from_cache else ""
+        if result is None:
+            self.log_signal.emit(f"{progress} 文件 {os.path.basename(file_path)} 中未找到合计数据{source}")
+            return
+        self.log_signal.emit(f"{progress} 在文件 {result.file_name} 中找到合计数据: {result.total}{source}")
+        if day not in day_entries or order < day_entries[day][0]:
+            day_entries[day] = (order, result.file_name, result.total)
+
+
 class ExcelProcessor(QMainWindow):
     log_update_signal = Signal(str)
     def __init__(self):
@@ -63,6 +171,17 @@ class ExcelProcessor(QMainWindow):
         self.remove_button.clicked.connect(self.remove_file)
         self.file_layout.addWidget(self.remove_button)
 
+        self.cache_checkbox = QCheckBox("使用提取缓存")
+        self.cache_checkbox.setChecked(True)
+        self.cache_checkbox.setToolTip("文件未修改时直接使用上次的提取结果；同版式的文件直接读取记住的合计位置")
+        self.file_layout.addWidget(self.cache_checkbox)
+
+        self.file_layout.addWidget(QLabel("查找标签："))
+        self.labels_input = QLineEdit("、".join(TOTAL_LABELS))
+        self.labels_input.setPlaceholderText("如：合计,总计,小计")
+        self.labels_input.setToolTip("取第一个包含任一标签的单元格下方的值；多个标签用逗号分隔")
+        self.file_layout.addWidget(self.labels_input)
+
         self.layout.addLayout(self.file_layout)
 
         # 自动识别年份与月份，无需手动输入
@@ -116,6 +235,9 @@ class ExcelProcessor(QMainWindow):
         # 存储选择的文件路径
         self.selected_files = []
         self.results = []
+        self.extract_thread = None  # 后台提取线程
+        self.extract_worker = None
+        self.extract_year_month = None  # 本次提取识别出的年月
         self.log_buffer = ""
         self.status_bar = self.statusBar()
         self.status_bar.showMessage("就绪")
@@ -170,31 +292,6 @@ class ExcelProcessor(QMainWindow):
             self.selected_files.pop(row)
             self.file_list.takeItem(row)
 
-    def process_excel(self, file_path):
-        # 读取Excel文件
-        df = pd.read_excel(file_path, header=None)
-
-        # 找到合计所在的行
-        total_row_index = None
-        for i, row in df.iterrows():
-            if '合计' in str(row.values):
-                total_row_index = i
-                break
-
-        if total_row_index is not None and total_row_index < len(df) - 1:
-            # 合计的下一行就是需要的数据
-            data_row_index = total_row_index + 1
-            data = df.iloc[data_row_index]
-
-            # 获取合计所在列的数据
-            total_column_index = row.index[row.apply(lambda x: '合计' in str(x))][0]
-            total_data = data.iloc[total_column_index]
-
-            log_msg = f"在文件 {os.path.basename(file_path)} 中找到合计数据: {total_data}"
-            self.log_update_signal.emit(log_msg)
-
-            return os.path.basename(file_path), total_data
-
     def extract_day_from_filename(self, file_path):
         name = os.path.basename(file_path)
         base = os.path.splitext(name)[0]
@@ -280,18 +377,36 @@ class ExcelProcessor(QMainWindow):
         return f"{y:04d}-{m:02d}-{d:02d}"
 
     def process_selected_files(self):
+        if self.extract_thread is not None:
+            self.log_update_signal.emit("提示：正在提取数据，请稍候")
+            return
         self.results = []
-        y, m = self.determine_year_month(self.selected_files)
-        day_entries = {}
+        self.extract_year_month = self.determine_year_month(self.selected_files)
+        tasks = []
         for file_path in self.selected_files:
             day = self.extract_day_from_filename(file_path)
             if day is None:
                 self.log_update_signal.emit(f"无法从文件名识别日期：{os.path.basename(file_path)}")
                 continue
-            result = self.process_excel(file_path)
-            if result:
-                if day not in day_entries:
-                    day_entries[day] = (os.path.basename(file_path), result[1])
+            tasks.append((day, file_path))
+
+        # 在后台线程中提取，界面保持响应
+        self.extract_thread = QtCore.QThread(self)
+        labels = split_labels(self.labels_input.text())
+        self.extract_worker = ExtractWorker(tasks, labels=labels, use_cache=self.cache_checkbox.isChecked())
+        self.extract_worker.moveToThread(self.extract_thread)
+        self.extract_thread.started.connect(self.extract_worker.run)
+        self.extract_worker.log_signal.connect(self.log_update_signal)
+        self.extract_worker.finished_signal.connect(self.on_extract_done)
+        self.extract_worker.finished_signal.connect(self.extract_thread.quit)
+        self.extract_worker.finished_signal.connect(self.extract_worker.deleteLater)
+        self.extract_thread.finished.connect(self.on_extract_finished)
+        self.extract_button.setEnabled(False)
+        self.log_update_signal.emit(f"开始提取 {len(tasks)} 个文件（查找标签：{'、'.join(labels)}）...")
+        self.extract_thread.start()
+
+    def on_extract_done(self, day_entries):
+        y, m = self.extract_year_month
         last_day = calendar.monthrange(y, m)[1]
         for d in range(1, last_day + 1):
             date_str = self.format_date(y, m, d)
@@ -304,6 +419,20 @@ class ExcelProcessor(QMainWindow):
         self.copy_button.setEnabled(bool(self.results))
         self.log_update_signal.emit(f"共提取 {len(self.results)} 条记录")
 
+    def on_extract_finished(self):
+        self.extract_thread.deleteLater()
+        self.extract_thread = None
+        self.extract_worker = None
+        self.extract_button.setEnabled(True)
+
+    def closeEvent(self, event):
+        # 关闭窗口时取消并等待后台提取结束
+        if self.extract_thread is not None:
+            self.extract_worker.cancel()
+            self.extract_thread.quit()
+            self.extract_thread.wait()
+        super().closeEvent(event)
+
     def save_results(self):
         if not self.results:
             QMessageBox.warning(self, "Warning", "没有可保存的结果！")
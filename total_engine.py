@@ -0,0 +1,174 @@
+"""Excel数据提取工具的数据处理核心（不依赖Qt，可在后台线程或子进程中调用）"""
+import os
+import re
+from dataclasses import dataclass
+from itertools import chain, islice
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from openpyxl.utils.exceptions import InvalidFileException
+
+from app_cache import DiskCache, file_signature, make_key
+
+TOTAL_LABELS = ("合计",)  # 默认只认“合计”，可传入 ("合计", "总计", "小计") 等标签组
+TEMPLATE_CACHE_NAME = "total_template"
+TEMPLATE_HEADER_ROWS = 5  # 版式指纹取前几行
+RESULT_CACHE_NAME = "total_result"
+
+
+@dataclass
+class ExtractResult:
+    """单个文件的提取结果（行列号均从0开始）"""
+    file_name: str
+    total: object  # 合计下一行同一列的值
+    row: int  # 取值单元格所在行
+    col: int  # 取值单元格所在列
+
+
+def split_labels(text):
+    """把“合计,总计,小计”形式的输入拆成标签元组（支持中英文逗号、顿号与斜杠），为空时返回默认标签"""
+    labels = tuple(dict.fromkeys(label.strip() for label in re.split(r"[,，、/]", text) if label.strip()))
+    return labels or TOTAL_LABELS
+
+
+def has_label(value, labels=TOTAL_LABELS):
+    """单元格文字是否包含任一标签"""
+    if value is None:
+        return False
+    text = str(value)
+    return any(label in text for label in labels)
+
+
+def find_label_col(values, labels=TOTAL_LABELS):
+    """返回一行中第一个包含标签的单元格列号，没有时返回 None"""
+    for col, value in enumerate(values):
+        if has_label(value, labels):
+            return col
+    return None
+
+
+def find_label_cell(df, labels=TOTAL_LABELS):
+    """在整个 DataFrame 中按行优先顺序查找第一个包含标签的单元格，返回 (行号, 列号)，没有时返回 None
+
+    每列做一次向量化的 str.contains：Excel 单元格中只有字符串可能包含文字标签，
+    数值与日期列直接跳过，混合列中的非字符串视为不匹配。找到候选后，后面的列只需检查候选行之前的部分。
+    """
+    pattern = "|".join(re.escape(label) for label in labels)
+    best = None
+    for col in range(df.shape[1]):
+        column = df.iloc[:, col]
+        if pd.api.types.is_numeric_dtype(column) or pd.api.types.is_datetime64_any_dtype(column):
+            continue
+        if best is not None:
+            column = column.iloc[:best[0]]
+        try:
+            hits = column.str.contains(pattern, regex=True, na=False).to_numpy(dtype=bool)
+        except AttributeError:
+            continue  # 该列（或检查范围内）没有字符串
+        if hits.any():
+            best = (int(hits.argmax()), col)  # 只检查了候选行之前的部分，命中即更靠前
+    return best
+
+
+def template_fingerprint(sheet_title, header_rows):
+    """版式指纹：工作表名 + 前几行文字单元格的位置与内容
+
+    文字中的数字替换为 #，标题里每天变化的日期不影响指纹。
+    """
+    cells = tuple((r, c, re.sub(r"\d+", "#", v.strip()))
+                  for r, values in enumerate(header_rows)
+                  for c, v in enumerate(values) if isinstance(v, str) and v.strip())
+    return make_key(sheet_title, cells)
+
+
+def scan_rows(file_name, rows, labels=TOTAL_LABELS):
+    """在行迭代器中查找第一个标签，读到其下一行即停止，返回 ExtractResult 或 None
+
+    与整表读取的结果一致：合计下方单元格为空时取 NaN；合计之后没有非空行时视为未找到。
+    """
+    for i, values in enumerate(rows):
+        col = find_label_col(values, labels)
+        if col is None:
+            continue
+
+        # 合计的下一行就是需要的数据；下一行整行为空时，需确认后面还有数据（否则整表读取会把它截掉）
+        for j, next_values in enumerate(rows, i + 1):
+            if j == i + 1:
+                value_row = next_values
+            if any(v is not None for v in next_values):
+                value = value_row[col] if col < len(value_row) else None
+                return ExtractResult(file_name, np.nan if value is None else value, i + 1, col)
+        return None
+    return None
+
+
+def read_cached_position(ws, file_name, label_row, col, labels=TOTAL_LABELS):
+    """按缓存的坐标只读取合计单元格与其下方单元格并核对，核对失败时返回 None
+
+    行列范围都显式给出：只读工作表缺少尺寸信息时，不给范围会先把整表扫一遍。
+    """
+    cells = [values[0] for values in ws.iter_rows(min_row=label_row + 1, max_row=label_row + 2,
+                                                  min_col=col + 1, max_col=col + 1, values_only=True)]
+    if len(cells) < 2 or not has_label(cells[0], labels):
+        return None
+    if cells[1] is None:
+        return None  # 下方单元格为空：交给完整扫描判断（需确认后面是否还有数据）
+    return ExtractResult(file_name, cells[1], label_row + 1, col)
+
+
+def extract_total_stream(file_path, use_cache=True, labels=TOTAL_LABELS):
+    """以只读行迭代器逐行读取第一个工作表，读到“合计”下一行即停止，返回 ExtractResult 或 None
+
+    use_cache 为真时按版式指纹记住合计坐标：同版式的文件直接读取该位置并核对，核对失败才逐行查找。
+    """
+    file_name = os.path.basename(file_path)
+    wb = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header_rows = list(islice(rows, TEMPLATE_HEADER_ROWS))
+        if not use_cache:
+            return scan_rows(file_name, chain(header_rows, rows), labels)
+
+        cache = DiskCache(TEMPLATE_CACHE_NAME, max_bytes=4 * 1024 * 1024)
+        key = make_key(template_fingerprint(ws.title, header_rows), tuple(labels))
+        position = cache.get(key)
+        if position is not None:
+            result = read_cached_position(ws, file_name, *position, labels)
+            if result is not None:
+                return result
+
+        result = scan_rows(file_name, chain(header_rows, rows), labels)
+        if result is not None and (result.row - 1, result.col) != position:
+            cache.put(key, (result.row - 1, result.col))
+        return result
+    finally:
+        wb.close()
+
+
+def extract_total_full(file_path, labels=TOTAL_LABELS):
+    """整表读取第一个工作表后查找标签，用于只读行迭代器无法打开的文件"""
+    df = pd.read_excel(file_path, header=None)
+    cell = find_label_cell(df, labels)
+    if cell is None:
+        return None
+
+    # 合计的下一行就是需要的数据，取合计所在列
+    i, col = cell
+    if i >= len(df) - 1:
+        return None
+    return ExtractResult(os.path.basename(file_path), df.iat[i + 1, col], i + 1, col)
+
+
+def extract_total(file_path, use_cache=True, labels=TOTAL_LABELS):
+    """读取文件第一个工作表，返回标签（默认“合计”）下一行同一列的值（ExtractResult）；未找到时返回 None"""
+    try:
+        return extract_total_stream(file_path, use_cache, labels)
+    except InvalidFileException:
+        return extract_total_full(file_path, labels)
+
+
+def result_cache_key(file_path, labels=TOTAL_LABELS):
+    """提取结果缓存键：文件路径、大小、修改时间与查找的标签组"""
+    return make_key(file_signature(file_path), tuple(labels))